@@ -2,14 +2,16 @@ import pygame
 from pygame.locals import *
 
 import states
+import map_grid
 import time
 
 class GameStateEngine(states.GameState):
     def __init__(self):
         states.GameState.__init__(self, None)
+        map_grid.start_solver_pool() #before pygame starts up, the solver processes are forked off us
         pygame.init()
 
-        self.screen = pygame.display.set_mode((800,600))
+        self.screen = pygame.display.set_mode(map_grid.SCREEN_SIZE)
         self.running = True
 
         self.fps = 1.0 / 60
@@ -34,6 +36,7 @@ class GameStateEngine(states.GameState):
         pygame.display.set_caption("Bug Me Not! - Pyweek #8 - April/May 2009 - Team PyedPypers")
 
     def shutdown(self):
+        map_grid.stop_solver_pool()
         pygame.quit()
         self.running = False
 
@@ -1,20 +1,1173 @@
-import random, heapq
+import random, heapq, time, array
+from collections import deque
 import objects
 
 INOPENLIST = 1
 INCLOSEDLIST = 2
 
+INFINITY = 1 << 30
+
+TOWER_AVOID_COST = 10 #extra cost for a flow field step right next to a tower
+PATH_CACHE_SIZE = 128 #how many finished searches calculate_path remembers
+CLUSTER_SIZE = 10 #cells per side of a hierarchical pathfinding cluster
+NEAR_AVOID_COST = 750 #what a* with avoid_towers adds for stepping next to anything
+PATH_NODE_BUDGET = 1500 #nodes queued path requests may expand per frame
+CLUSTER_NODE_BUDGET = 1500 #nodes cluster graph rebuilds may expand per frame
+PATH_SLICE = 50 #how often a queued search checks whether the frame's budget is spent
+ROUTE_BANK_SIZE = 6 #different hive to hero routes kept ready for new insects
+CELL_SIZE = 20 #pixels per side of a grid cell
+MAP_SIZE = (800, 500) #pixels of lawn
+UI_HEIGHT = 100 #pixels of ui bar under the lawn
+SCREEN_SIZE = (MAP_SIZE[0], MAP_SIZE[1] + UI_HEIGHT)
+ENEMY_AREA = 200 #pixels square in the top left corner that belong to the hive
+HERO_AREA = 160 #and in the bottom right for the hero
+
+#the 8 cells around a cell, in order, so each is next to the ones either side of it
+RING = ((-1,-1), (0,-1), (1,-1), (1,0), (1,1), (0,1), (-1,1), (-1,0))
+SOLVER_PROCESSES = 0 #processes to solve queued path requests on, 0 keeps them in the game loop
+SOLVER_BATCH = 16 #queued requests handed to a solver process at once
+LAYOUT_POOL_SIZE = 3 #checked lawn layouts kept ready for new games
+LAYOUT_SCRAPS = 10 #scraps laid out per layout, the most any difficulty starts with
+TELEMETRY_FRAMES = 600 #frames of per frame call counts PathTelemetry keeps
+
+solver_pool = None #multiprocessing pool started by start_solver_pool
+solver_processes = 0
+solver_arenas = {} #grid size -> SearchArena, for solve_batch inside a solver process
+layouts = deque() #Layouts ready for take_layout, see top_up_layouts
+layout_seeds = random.Random() #where the seeds for new layouts come from
+
+class IndexedHeap(object):
+    """A binary min-heap of integer nodes (flat grid indices) that knows where
+       each node sits, so a node's cost can be lowered in place (decrease-key)
+       instead of pushing a duplicate or scanning the open list for it."""
+    def __init__(self, size):
+        self.heap = [] # (cost, node) pairs
+        self.position = [-1] * size # node -> index into heap, -1 if not in it
+        self.peak = 0 # most nodes in the heap at once since the last clear
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, node):
+        return self.position[node] != -1
+
+    def clear(self):
+        for cost, node in self.heap:
+            self.position[node] = -1
+        self.heap = []
+        self.peak = 0
+
+    def push(self, node, cost):
+        self.heap.append((cost, node))
+        self.sift_up(len(self.heap) - 1)
+        if len(self.heap) > self.peak:
+            self.peak = len(self.heap)
+
+    def pop(self):
+        """Remove and return (cost, node) for the cheapest node."""
+        heap = self.heap
+        last = heap.pop()
+        if heap:
+            top = heap[0]
+            heap[0] = last
+            self.sift_down(0)
+        else:
+            top = last
+        self.position[top[1]] = -1
+        return top
+
+    def peek(self):
+        return self.heap[0]
+
+    def remove(self, node):
+        i = self.position[node]
+        self.position[node] = -1
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.sift_up(i)
+            self.sift_down(self.position[last[1]])
+
+    def decrease(self, node, cost):
+        """Lower the cost of a node already in the heap."""
+        i = self.position[node]
+        self.heap[i] = (cost, node)
+        self.sift_up(i)
+
+    def sift_up(self, i):
+        heap = self.heap
+        position = self.position
+        item = heap[i]
+        while i:
+            parent = (i - 1) >> 1
+            above = heap[parent]
+            if item < above:
+                heap[i] = above
+                position[above[1]] = i
+                i = parent
+            else:
+                break
+        heap[i] = item
+        position[item[1]] = i
+
+    def sift_down(self, i):
+        heap = self.heap
+        position = self.position
+        size = len(heap)
+        item = heap[i]
+        child = 2*i + 1
+        while child < size:
+            right = child + 1
+            if right < size and heap[right] < heap[child]:
+                child = right
+            below = heap[child]
+            if below < item:
+                heap[i] = below
+                position[below[1]] = i
+                i = child
+                child = 2*i + 1
+            else:
+                break
+        heap[i] = item
+        position[item[1]] = i
+
+class Path(object):
+    """A found path, which never changes once it is made so everyone going the same way
+       can share one. waypoints are the few cells a unit actually has to walk to (see
+       MapGrid.smooth_path) and points the screen position of each waypoint's centre, worked
+       out up front - walkers keep their own place in it with a PathCursor (see walk).
+       Only those are kept, but it reads like a tuple of the cells walked between them."""
+    def __init__(self, waypoints, points):
+        self.waypoints = tuple(waypoints)
+        self.points = tuple(points)
+
+    def __len__(self):
+        length = 1
+        for a, b in zip(self.waypoints, self.waypoints[1:]):
+            length += abs(b[0]-a[0]) + abs(b[1]-a[1])
+        return length
+
+    def __getitem__(self, i):
+        return list(self)[i]
+
+    def __iter__(self):
+        """Walk the waypoints the way units do - diagonally until lined up with the next
+           one and then straight on (see MapGrid.clear_walk) - a step across then a step
+           down for each diagonal one."""
+        x, y = self.waypoints[0]
+        yield x, y
+        for endx, endy in self.waypoints[1:]:
+            while (x, y) != (endx, endy):
+                if x != endx:
+                    x += cmp(endx, x)
+                    yield x, y
+                if y != endy:
+                    y += cmp(endy, y)
+                    yield x, y
+
+    def walk(self, index=0):
+        """Return a new cursor to walk this path with, from waypoint index on."""
+        return PathCursor(self, index)
+
+class PathCursor(object):
+    """One walker's place along a shared Path. It is false once the walker is past the end."""
+    def __init__(self, path, index=0):
+        self.path = path
+        self.index = index
+
+    def __nonzero__(self):
+        return self.index < len(self.path.waypoints)
+
+    def __len__(self):
+        return len(self.path.waypoints) - self.index
+
+    def cell(self):
+        """The cell we are heading for."""
+        return self.path.waypoints[self.index]
+
+    def point(self):
+        """The screen position we are heading for."""
+        return self.path.points[self.index]
+
+    def advance(self):
+        self.index += 1
+
+class PathRequest(object):
+    """Handle for a path search queued with MapGrid.request_path.
+       Poll done - once it is set, path holds the result (a Path, or False)."""
+    def __init__(self, start, end, avoid_towers=True, very_random=True, seed=None):
+        self.start = start
+        self.end = end
+        self.avoid_towers = avoid_towers
+        self.very_random = very_random
+        self.seed = seed #for the a*'s random edge costs - the same seed gets the same route
+
+        self.done = False
+        self.cancelled = False
+        self.path = False
+        self.expanded = 0
+
+        self.steps = None #the search generator while it is running
+        self.key = None #cache key, including the grid version the search started on
+        self.followers = [] #identical requests from the same frame, waiting on this one's search
+        self.caller = None #class name of whoever asked, for the telemetry
+        self.open_peak = 0
+        self.seconds = 0.0 #spent searching, over however many frames it took
+
+    def finish(self, path):
+        self.path = path or False
+        self.done = True
+        for i in self.followers:
+            i.finish(path)
+
+    def cancel(self):
+        """Nobody is waiting on this any more, drop it from the queue."""
+        self.cancelled = True
+
+    def wanted(self):
+        """Whether anyone still wants the search run - us, or a request following us."""
+        if not self.cancelled:
+            return True
+        for i in self.followers:
+            if not i.cancelled:
+                return True
+        return False
+
+    def cache_key(self, version):
+        #the key calculate_path would use for a plain a* search
+        return (self.start, self.end, self.avoid_towers, self.very_random, False, False, self.seed, version)
+
+class SearchArena(object):
+    """Scratch space for searches over one MapGrid, reused from call to call.
+       Instead of clearing every list before a search, each search bumps the
+       generation and only trusts entries stamped with the current one."""
+    def __init__(self, size):
+        self.generation = 0
+        self.stamp = [0] * size
+        self.inlist = [0] * size
+        self.movecost = [0] * size
+        self.cost = [0] * size
+        self.parent = [-1] * size
+        self.openlist = IndexedHeap(size)
+
+    def reset(self):
+        self.generation += 1
+        self.openlist.clear()
+
+def astar_steps(grid, near, size, request, arena, slice=None):
+    """Run the a* search for request over grid inside arena, finishing the request with the result.
+       This is a generator - with a slice it pauses every slice nodes so the search can be
+       resumed later, without one it runs straight through on the first next().
+       It only touches what it is handed - the random edge costs come from its own stream
+       seeded with request.seed - so it runs just as well in a solver process as in the game."""
+    start = request.start
+    end = request.end
+    avoid_towers = request.avoid_towers
+    very_random = request.very_random
+
+    blockedmap = grid
+
+    # some useful info
+    numcols, numrows = size
+    endx, endy = end
+    endindex = endy*numcols + endx
+
+    # scratch lists live in the arena - a node's entries only count once it is stamped with this generation
+    arena.reset()
+    generation = arena.generation
+    stamp = arena.stamp
+    inlist = arena.inlist
+    movecosts = arena.movecost
+    costs = arena.cost
+    parentlist = arena.parent
+    openlist = arena.openlist
+
+    # add starting location to open list-- hopefully it is on our map...
+    index = start[1]*numcols + start[0]
+    stamp[index] = generation
+    inlist[index] = INOPENLIST
+    movecosts[index] = 0
+    costs[index] = -1
+    parentlist[index] = -1
+    openlist.push(index, -1)
+
+    # loop through map until path is found
+    r = random.Random(request.seed).randrange
+
+    if very_random:
+        ru = 50
+    else:
+        ru = 10
+
+    adjacent = [(0,-1, 1+r(ru)), (-1, 0, 1+r(ru)), (1, 0, 1+r(ru)), (0, 1, 1+r(ru))]
+
+    swap_adj = 0
+    expanded = 0
+
+    while True:
+        swap_adj += 1
+        if swap_adj > 25:
+            swap_adj = 0
+            adjacent = [(0,-1, 1+r(ru)), (-1, 0, 1+r(ru)), (1, 0, 1+r(ru)), (0, 1, 1+r(ru))]
+        # if open heap is empty, no path is available
+        if len(openlist) == 0:
+            request.expanded = expanded
+            request.finish(False)
+            return
+
+        # pop lowest open node from the heap
+        cost, index = openlist.pop()
+        expanded += 1
+        if slice and not expanded % slice:
+            request.expanded = expanded
+            yield expanded
+
+        # if this is target, build path and return
+        if index == endindex:
+            path = []
+            while index != -1:
+                path.append((index%numcols, index/numcols))
+                index = parentlist[index]
+
+            path.reverse()
+            request.expanded = expanded
+            request.finish(path)
+            return
+
+        # add it to the closed list
+        inlist[index] = INCLOSEDLIST
+        x = index % numcols
+        y = index / numcols
+        movecost = movecosts[index]
+
+        # check adjacent nodes
+        for modx, mody, modmovecost in adjacent:
+            newx = x + modx
+            newy = y + mody
+
+            # skip if off map
+            if newx < 0 or newx >= numcols or newy < 0 or newy >= numrows:
+                continue
+            newindex = newy*numcols + newx
+
+            # skip if not walkable
+            if blockedmap[newindex] >= 2:
+                if not newindex == endindex:
+                    continue
+
+            newmovecost = movecost + modmovecost
+
+            # first time this search has touched the node
+            if stamp[newindex] != generation:
+                # heuristic is only worked out for nodes we actually reach
+                newcost = newmovecost + abs(endx - newx) + abs(endy - newy)
+
+                if avoid_towers:
+                    if near[newindex]:
+                        newcost += NEAR_AVOID_COST
+
+                # add to open list
+                stamp[newindex] = generation
+                inlist[newindex] = INOPENLIST
+                movecosts[newindex] = newmovecost
+                costs[newindex] = newcost
+                parentlist[newindex] = index
+                openlist.push(newindex, newcost)
+
+            # on open list, check if this path is cheaper and update it
+            elif inlist[newindex] == INOPENLIST and newmovecost < movecosts[newindex]:
+                # keep the heuristic and any tower penalty, just swap in the cheaper move cost
+                newcost = costs[newindex] - movecosts[newindex] + newmovecost
+
+                openlist.decrease(newindex, newcost)
+                movecosts[newindex] = newmovecost
+                costs[newindex] = newcost
+                parentlist[newindex] = index
+
+def uniform_cost(request):
+    """Whether request can go to jump point search instead of a* - when there is no tower
+       penalty and very_random is off. a* would still jitter its edge costs a little (1+r(10))
+       even then, jump point search doesn't: those paths come out the same every time, which
+       for workers and bots heading somewhere is what we want."""
+    return not (request.avoid_towers or request.very_random)
+
+def jps_steps(grid, size, request, arena, slice=None):
+    """Jump point search for a uniform cost request, a drop in for astar_steps.
+       Moves are only ever straight, so rather than opening every neighbour it runs
+       along each direction until something interesting turns up (the goal, or an
+       opening beside a wall) and only opens that. The path is filled back in cell by
+       cell at the end, so callers can't tell the difference."""
+    start = request.start
+    end = request.end
+
+    numcols, numrows = size
+    endx, endy = end
+    endindex = endy*numcols + endx
+
+    def walkable(x, y):
+        if x < 0 or x >= numcols or y < 0 or y >= numrows:
+            return False
+        index = y*numcols + x
+        return grid[index] < 2 or index == endindex #like a*, we may step onto a blocked goal
+
+    def jump_x(x, y, dx):
+        # run along the row until we hit a wall, the goal, or an opening the wall behind us hid
+        while walkable(x, y):
+            if x == endx and y == endy:
+                return x, y
+            if (walkable(x, y-1) and not walkable(x-dx, y-1)) or\
+               (walkable(x, y+1) and not walkable(x-dx, y+1)):
+                return x, y
+            x += dx
+        return None
+
+    def jump_y(x, y, dy):
+        # same up the column, but we also stop wherever a row branching off leads somewhere
+        while walkable(x, y):
+            if x == endx and y == endy:
+                return x, y
+            if (walkable(x-1, y) and not walkable(x-1, y-dy)) or\
+               (walkable(x+1, y) and not walkable(x+1, y-dy)):
+                return x, y
+            if jump_x(x+1, y, 1) or jump_x(x-1, y, -1):
+                return x, y
+            y += dy
+        return None
+
+    arena.reset()
+    generation = arena.generation
+    stamp = arena.stamp
+    inlist = arena.inlist
+    movecosts = arena.movecost
+    parentlist = arena.parent
+    openlist = arena.openlist
+
+    index = start[1]*numcols + start[0]
+    stamp[index] = generation
+    inlist[index] = INOPENLIST
+    movecosts[index] = 0
+    parentlist[index] = -1
+    openlist.push(index, 0)
+
+    expanded = 0
+
+    while len(openlist):
+        cost, index = openlist.pop()
+        expanded += 1
+        if slice and not expanded % slice:
+            request.expanded = expanded
+            yield expanded
+
+        if index == endindex:
+            # fill in the straight runs between jump points
+            path = [end]
+            while parentlist[index] != -1:
+                x, y = index % numcols, index / numcols
+                index = parentlist[index]
+                px, py = index % numcols, index / numcols
+                while (x, y) != (px, py):
+                    x += cmp(px, x)
+                    y += cmp(py, y)
+                    path.append((x, y))
+
+            path.reverse()
+            request.expanded = expanded
+            request.finish(path)
+            return
+
+        inlist[index] = INCLOSEDLIST
+        x = index % numcols
+        y = index / numcols
+        movecost = movecosts[index]
+
+        # only carry on the way we came, or turn off it - never double back
+        parent = parentlist[index]
+        if parent == -1:
+            directions = ((0, -1), (-1, 0), (1, 0), (0, 1))
+        else:
+            dx = cmp(x, parent % numcols)
+            dy = cmp(y, parent / numcols)
+            if dx:
+                directions = ((dx, 0), (0, -1), (0, 1))
+            else:
+                directions = ((0, dy), (-1, 0), (1, 0))
+
+        for dx, dy in directions:
+            if dx:
+                point = jump_x(x+dx, y, dx)
+            else:
+                point = jump_y(x, y+dy, dy)
+            if not point:
+                continue
+
+            newx, newy = point
+            newindex = newy*numcols + newx
+            newmovecost = movecost + abs(newx - x) + abs(newy - y)
+            newcost = newmovecost + abs(endx - newx) + abs(endy - newy)
+
+            if stamp[newindex] != generation:
+                stamp[newindex] = generation
+                inlist[newindex] = INOPENLIST
+                movecosts[newindex] = newmovecost
+                parentlist[newindex] = index
+                openlist.push(newindex, newcost)
+
+            elif inlist[newindex] == INOPENLIST and newmovecost < movecosts[newindex]:
+                openlist.decrease(newindex, newcost)
+                movecosts[newindex] = newmovecost
+                parentlist[newindex] = index
+
+    request.expanded = expanded
+    request.finish(False)
+
+def solve_batch(size, grid, near, queries):
+    """Solve a batch of queued searches against a snapshot of the grid - this is what runs
+       in the solver processes. queries is a list of (start, end, avoid_towers, very_random, seed),
+       and it returns a (path, expanded, open list peak) for each."""
+    grid = array.array('B', grid)
+    near = array.array('B', near)
+    if not size in solver_arenas:
+        solver_arenas[size] = SearchArena(size[0] * size[1])
+    arena = solver_arenas[size]
+
+    results = []
+    for start, end, avoid_towers, very_random, seed in queries:
+        request = PathRequest(start, end, avoid_towers, very_random, seed)
+        if uniform_cost(request):
+            steps = jps_steps(grid, size, request, arena)
+        else:
+            steps = astar_steps(grid, near, size, request, arena)
+        for i in steps:
+            pass
+        results.append((request.path, request.expanded, arena.openlist.peak))
+    return results
+
+def start_solver_pool(processes=SOLVER_PROCESSES):
+    """Start the processes queued path requests get solved on, if processes isn't 0.
+       Call this before pygame opens its window, the workers are forked off this process.
+       Returns the pool, or None if there isn't one - then update_requests solves them itself."""
+    global solver_pool, solver_processes
+    if processes and not solver_pool:
+        try:
+            import multiprocessing
+            solver_pool = multiprocessing.Pool(processes)
+            solver_processes = processes
+        except (ImportError, OSError):
+            solver_pool = None #no working multiprocessing here
+    return solver_pool
+
+def stop_solver_pool():
+    global solver_pool, solver_processes
+    if solver_pool:
+        solver_pool.terminate()
+        solver_pool.join()
+        solver_pool = None
+        solver_processes = 0
+
+class FlowField(object):
+    """A distance field toward a single goal cell.
+       Every ground insect is headed for the same place, so instead of each one
+       running its own a* they all read their next step out of one of these.
+
+       The field is kept up to date incrementally (LPA*, searching back from the
+       goal with no heuristic): when MapGrid.set changes a cell only the cells
+       whose distance actually changes get touched, so building a tower mid-wave
+       does not cost a replan per bug."""
+    def __init__(self, map_grid, goal):
+        self.map_grid = map_grid
+        self.goal = goal
+
+        numcols, numrows = map_grid.size
+        self.g = [INFINITY] * (numcols * numrows) #settled distances
+        self.rhs = [INFINITY] * (numcols * numrows) #one step lookahead distances
+        self.queue = IndexedHeap(numcols * numrows) #inconsistent cells
+        self.pending = []
+
+        self.goal_index = -1
+        if not map_grid.out_of_bounds(goal):
+            self.goal_index = map_grid.index(goal)
+            self.rhs[self.goal_index] = 0
+            self.queue.push(self.goal_index, 0)
+
+    def cells_changed(self, cells):
+        """The cost of walking into these cells changed, they get looked at next time we are asked for a step."""
+        self.pending.extend(cells)
+
+    def enter_cost(self, index):
+        """Cost of stepping into a cell, or INFINITY if it blocks."""
+        if self.map_grid.grid[index] >= 2 and index != self.goal_index:
+            return INFINITY
+        if self.map_grid.tower_near[index]:
+            return 1 + TOWER_AVOID_COST
+        return 1
+
+    def neighbours(self, index):
+        numcols, numrows = self.map_grid.size
+        x = index % numcols
+        y = index / numcols
+        n = []
+        if y > 0:
+            n.append(index - numcols)
+        if x > 0:
+            n.append(index - 1)
+        if x < numcols - 1:
+            n.append(index + 1)
+        if y < numrows - 1:
+            n.append(index + numcols)
+        return n
+
+    def update_cell(self, index):
+        """Recalculate the lookahead distance of a cell and requeue it if it is now inconsistent."""
+        if index != self.goal_index:
+            if self.map_grid.grid[index] >= 2:
+                best = INFINITY
+            else:
+                best = INFINITY
+                g = self.g
+                for n in self.neighbours(index):
+                    if g[n] < INFINITY:
+                        cost = g[n] + self.enter_cost(n)
+                        if cost < best:
+                            best = cost
+            self.rhs[index] = best
+
+        if index in self.queue:
+            self.queue.remove(index)
+        if self.g[index] != self.rhs[index]:
+            self.queue.push(index, min(self.g[index], self.rhs[index]))
+
+    def repair(self):
+        """Bring the field back up to date after cell changes."""
+        if self.pending:
+            seen = {}
+            for pos in self.pending:
+                if self.map_grid.out_of_bounds(pos):
+                    continue
+                index = self.map_grid.index(pos)
+                for i in [index] + self.neighbours(index):
+                    if not i in seen:
+                        seen[i] = True
+                        self.update_cell(i)
+            self.pending = []
+
+        g = self.g
+        rhs = self.rhs
+        queue = self.queue
+        while queue:
+            key, index = queue.pop()
+            if g[index] > rhs[index]:
+                g[index] = rhs[index]
+            else:
+                g[index] = INFINITY
+                self.update_cell(index)
+            for n in self.neighbours(index):
+                self.update_cell(n)
+
+    def next_step(self, pos):
+        """Return the neighbour of pos to move to next, or None if pos is the goal
+           or the goal can't be reached from here."""
+        if self.pending or self.queue:
+            self.repair()
+        if pos == self.goal or self.map_grid.out_of_bounds(pos):
+            return None
+
+        g = self.g
+        numcols = self.map_grid.size[0]
+        best = INFINITY
+        choices = []
+        for n in self.neighbours(pos[1]*numcols + pos[0]):
+            if g[n] == INFINITY:
+                continue
+            cost = g[n] + self.enter_cost(n)
+            if cost < best:
+                best = cost
+                choices = [(n%numcols, n/numcols)]
+            elif cost == best:
+                choices.append((n%numcols, n/numcols))
+
+        if not choices:
+            return None
+        if len(choices) == 1:
+            return choices[0]
+        return self.map_grid.rng.choice(choices) #spread the bugs out a little over equal routes
+
+class ClusterGraph(object):
+    """Hierarchical (HPA*) view of a MapGrid, for long searches on big lawns.
+       The grid is cut into CLUSTER_SIZE square clusters. Where two clusters
+       touch we pick a few entrance cells, and inside each cluster we store the
+       walking cost between its entrances. A long search then runs over that
+       small entrance graph, and only the legs it picks get refined into cells,
+       each with a search that never leaves one cluster.
+       Stepping next to anything costs NEAR_AVOID_COST more with avoid_towers, as
+       it does for a*, but there are no random edge costs. On pathbench's 200x125
+       lawns its paths come out about 13% longer than the shortest (417 cells against
+       368) and building the graph takes about 1.6 s a map.
+       Clusters MapGrid.set touches are rebuilt a budget at a time by refresh, and
+       the graph can't be searched until it is ready again."""
+    def __init__(self, map_grid, avoid_towers):
+        self.map_grid = map_grid
+        self.avoid_towers = avoid_towers
+
+        numcols, numrows = map_grid.size
+        self.columns = (numcols + CLUSTER_SIZE - 1) / CLUSTER_SIZE
+        self.rows = (numrows + CLUSTER_SIZE - 1) / CLUSTER_SIZE
+
+        self.expanded = 0 #nodes popped by the last find_path, abstract and local
+
+        self.borders = {} #(cluster, cluster) -> list of (cell, cell) transitions
+        self.inter = {} #cell -> [(cell, cost)] across borders
+        self.intra = {} #cluster -> {cell: [(cell, cost)]} inside the cluster
+        self.stale = {} #clusters whose borders are done but whose intra costs aren't
+        self.dirty = {}
+        for x in xrange(self.columns):
+            for y in xrange(self.rows):
+                self.dirty[(x, y)] = True
+
+    def cluster_of(self, pos):
+        return pos[0] / CLUSTER_SIZE, pos[1] / CLUSTER_SIZE
+
+    def bounds(self, cluster):
+        """Return the (left, top, right, bottom) cells of a cluster, right/bottom exclusive."""
+        numcols, numrows = self.map_grid.size
+        return (cluster[0]*CLUSTER_SIZE, cluster[1]*CLUSTER_SIZE,
+                min((cluster[0]+1)*CLUSTER_SIZE, numcols), min((cluster[1]+1)*CLUSTER_SIZE, numrows))
+
+    def neighbour_clusters(self, cluster):
+        n = []
+        for x, y in ((cluster[0], cluster[1]-1), (cluster[0]-1, cluster[1]),
+                     (cluster[0]+1, cluster[1]), (cluster[0], cluster[1]+1)):
+            if x >= 0 and x < self.columns and y >= 0 and y < self.rows:
+                n.append((x, y))
+        return n
+
+    def mark_dirty(self, pos):
+        self.dirty[self.cluster_of(pos)] = True
+
+    def walkable(self, pos):
+        return self.map_grid.grid[pos[1]*self.map_grid.size[0] + pos[0]] < 2
+
+    def enter_cost(self, pos):
+        if self.avoid_towers and self.map_grid.near[pos[1]*self.map_grid.size[0] + pos[0]]:
+            return 1 + NEAR_AVOID_COST
+        return 1
+
+    def scan_border(self, a, b):
+        """Find the transitions between two neighbouring clusters, a being left of or above b."""
+        left, top, right, bottom = self.bounds(a)
+        if b[0] > a[0]:
+            pairs = [((right-1, y), (right, y)) for y in xrange(top, bottom)]
+        else:
+            pairs = [((x, bottom-1), (x, bottom)) for x in xrange(left, right)]
+
+        transitions = []
+        run = []
+        for pair in pairs + [None]:
+            if pair and self.walkable(pair[0]) and self.walkable(pair[1]):
+                run.append(pair)
+                continue
+            if run:
+                if len(run) < 6:
+                    transitions.append(run[len(run)/2])
+                else:
+                    transitions.append(run[0])
+                    transitions.append(run[-1])
+                run = []
+        return transitions
+
+    def ready(self):
+        return not (self.dirty or self.stale)
+
+    def set_border(self, a, b):
+        """Rescan the border between two neighbouring clusters and swap its transitions in."""
+        for cella, cellb in self.borders.get((a, b), []):
+            self.inter[cella] = [i for i in self.inter[cella] if i[0] != cellb]
+            self.inter[cellb] = [i for i in self.inter[cellb] if i[0] != cella]
+        transitions = self.scan_border(a, b)
+        for cella, cellb in transitions:
+            self.inter.setdefault(cella, []).append((cellb, self.enter_cost(cellb)))
+            self.inter.setdefault(cellb, []).append((cella, self.enter_cost(cella)))
+        self.borders[(a, b)] = transitions
+
+    def entrances(self, cluster):
+        cells = {}
+        for n in self.neighbour_clusters(cluster):
+            if cluster < n:
+                for cella, cellb in self.borders.get((cluster, n), []):
+                    cells[cella] = True
+            else:
+                for cella, cellb in self.borders.get((n, cluster), []):
+                    cells[cellb] = True
+        return cells
+
+    def refresh(self, budget=None):
+        """Rebuild the entrances and costs of any clusters changed since last time.
+           The borders are cheap and all get done; the costs inside clusters stop once
+           budget nodes have been expanded, and carry on next time.
+           Returns the nodes expanded."""
+        for cluster in self.dirty:
+            self.stale[cluster] = True
+            for n in self.neighbour_clusters(cluster):
+                self.stale[n] = True #their entrances on the shared border may have moved
+                self.set_border(min(cluster, n), max(cluster, n))
+        self.dirty = {}
+
+        self.expanded = 0
+        while self.stale and (budget == None or self.expanded < budget):
+            cluster = self.stale.popitem()[0]
+            entrances = self.entrances(cluster)
+            edges = {}
+            for cell in entrances:
+                costs = self.local_costs(cell, cluster)
+                edges[cell] = [(other, costs[other]) for other in entrances if other != cell and other in costs]
+            self.intra[cluster] = edges
+        return self.expanded
+
+    def local_costs(self, origin, cluster, reverse=False):
+        """Dijkstra inside one cluster from origin, returning {cell: cost}.
+           With reverse the costs are for walking from each cell to origin instead."""
+        left, top, right, bottom = self.bounds(cluster)
+        dist = {origin: 0}
+        openlist = [(0, origin)]
+        while openlist:
+            cost, pos = heapq.heappop(openlist)
+            if cost > dist[pos]:
+                continue
+            self.expanded += 1
+            if reverse:
+                step = cost + self.enter_cost(pos)
+            for n in ((pos[0], pos[1]-1), (pos[0]-1, pos[1]), (pos[0]+1, pos[1]), (pos[0], pos[1]+1)):
+                if n[0] < left or n[0] >= right or n[1] < top or n[1] >= bottom:
+                    continue
+                if not self.walkable(n):
+                    continue
+                if not reverse:
+                    step = cost + self.enter_cost(n)
+                if not n in dist or step < dist[n]:
+                    dist[n] = step
+                    heapq.heappush(openlist, (step, n))
+        return dist
+
+    def local_path(self, start, end, cluster):
+        """A* from start to end without leaving cluster, returns a list of cells or None."""
+        left, top, right, bottom = self.bounds(cluster)
+        dist = {start: 0}
+        parent = {start: None}
+        openlist = [(0, 0, start)]
+        while openlist:
+            f, cost, pos = heapq.heappop(openlist)
+            self.expanded += 1
+            if pos == end:
+                path = []
+                while pos:
+                    path.append(pos)
+                    pos = parent[pos]
+                path.reverse()
+                return path
+            if cost > dist[pos]:
+                continue
+            for n in ((pos[0], pos[1]-1), (pos[0]-1, pos[1]), (pos[0]+1, pos[1]), (pos[0], pos[1]+1)):
+                if n[0] < left or n[0] >= right or n[1] < top or n[1] >= bottom:
+                    continue
+                if not (n == end or self.walkable(n)):
+                    continue
+                step = cost + self.enter_cost(n)
+                if not n in dist or step < dist[n]:
+                    dist[n] = step
+                    parent[n] = pos
+                    heapq.heappush(openlist, (step + abs(end[0]-n[0]) + abs(end[1]-n[1]), step, n))
+        return None
+
+    def anchors(self, pos, leaving):
+        """The open cells a search can leave pos by (or, not leaving, reach it from) with the cost
+           of the step between - pos itself if it is open, otherwise its open neighbours, which
+           may well be in another cluster. Goals are often blocked, like scraps and towers."""
+        if self.walkable(pos):
+            return [(pos, 0)]
+        numcols, numrows = self.map_grid.size
+        anchors = []
+        for n in ((pos[0], pos[1]-1), (pos[0]-1, pos[1]), (pos[0]+1, pos[1]), (pos[0], pos[1]+1)):
+            if n[0] >= 0 and n[0] < numcols and n[1] >= 0 and n[1] < numrows and self.walkable(n):
+                if leaving:
+                    anchors.append((n, self.enter_cost(n)))
+                else:
+                    anchors.append((n, self.enter_cost(pos)))
+        return anchors
+
+    def find_path(self, start, end):
+        """Return a list of cells from start to end, or False if there is no way through."""
+        if start == end:
+            return [start]
+        self.expanded = 0
+
+        startcluster = self.cluster_of(start)
+        endcluster = self.cluster_of(end)
+        if startcluster == endcluster:
+            path = self.local_path(start, end, startcluster)
+            if path:
+                return path
+
+        #hook start and end into the entrance graph for this search only, through whichever
+        #open cells they are left and reached by - legs says how to walk those edges
+        legs = {}
+        ends = self.anchors(end, False)
+        end_costs = {}
+        for anchor, extra in ends:
+            cluster = self.cluster_of(anchor)
+            costs = self.local_costs(anchor, cluster, True)
+            for cell in self.intra.get(cluster, {}):
+                if cell in costs and (not cell in end_costs or costs[cell] + extra < end_costs[cell]):
+                    end_costs[cell] = costs[cell] + extra
+                    legs[(cell, end)] = (cell, anchor, cluster)
+        start_edges = {}
+        for anchor, extra in self.anchors(start, True):
+            cluster = self.cluster_of(anchor)
+            costs = self.local_costs(anchor, cluster)
+            targets = [(cell, cell, 0) for cell in self.intra.get(cluster, {}) if cell != start]
+            targets += [(end, a, e) for a, e in ends if self.cluster_of(a) == cluster]
+            for node, cell, more in targets:
+                if cell in costs and (not node in start_edges or extra + costs[cell] + more < start_edges[node]):
+                    start_edges[node] = extra + costs[cell] + more
+                    legs[(start, node)] = (anchor, cell, cluster)
+        start_edges = start_edges.items()
+
+        dist = {start: 0}
+        parent = {start: None}
+        openlist = [(0, 0, start)]
+        while openlist:
+            f, cost, pos = heapq.heappop(openlist)
+            self.expanded += 1
+            if pos == end:
+                break
+            if cost > dist[pos]:
+                continue
+            if pos == start:
+                edges = start_edges + self.inter.get(pos, [])
+            else:
+                edges = self.intra[self.cluster_of(pos)].get(pos, []) + self.inter.get(pos, [])
+                if pos in end_costs:
+                    edges = edges + [(end, end_costs[pos])]
+            for n, step in edges:
+                step += cost
+                if not n in dist or step < dist[n]:
+                    dist[n] = step
+                    parent[n] = pos
+                    heapq.heappush(openlist, (step + abs(end[0]-n[0]) + abs(end[1]-n[1]), step, n))
+        else:
+            return False
+
+        waypoints = []
+        pos = end
+        while pos:
+            waypoints.append(pos)
+            pos = parent[pos]
+        waypoints.reverse()
+
+        #refine each leg of the abstract path into actual cells
+        path = [start]
+        for a, b in zip(waypoints, waypoints[1:]):
+            if (a, b) in legs:
+                froms, to, cluster = legs[(a, b)]
+                leg = self.local_path(froms, to, cluster)
+                if not leg:
+                    return False
+                if froms != a:
+                    leg = [a] + leg
+                if to != b:
+                    leg = leg + [b]
+            elif abs(a[0]-b[0]) + abs(a[1]-b[1]) == 1:
+                leg = [a, b]
+            else:
+                leg = self.local_path(a, b, self.cluster_of(a))
+                if not leg:
+                    return False
+            path.extend(leg[1:])
+        return path
+
+class RouteBank(object):
+    """A handful of different routes between two cells, for when lots of units make the same
+       trip. The routes are searched for through the request queue, each with its own seed
+       so they wander differently. When MapGrid.set changes a cell on or right next to one
+       of them only that one is thrown out and searched for again - towers and traps go down
+       all the time, and mostly nowhere near most of the routes."""
+    def __init__(self, map_grid, start, end, size=ROUTE_BANK_SIZE):
+        self.map_grid = map_grid
+        self.start = start
+        self.end = end
+        self.size = size
+
+        self.routes = []
+        self.cells = [] #the cells along each of routes, to check changes against
+        self.requests = []
+        self.seed = 0
+        self.next = 0
+        for i in xrange(size):
+            self.search()
+
+    def search(self):
+        self.requests.append(self.map_grid.request_path(self.start, self.end, True, True, self.seed, self))
+        self.seed += 1
+
+    def cell_changed(self, pos):
+        """Throw out the routes that go through or right next to pos, and search for new ones."""
+        x, y = pos
+        for i in xrange(len(self.routes)-1, -1, -1):
+            cells = self.cells[i]
+            for dx, dy in ((0, 0),) + RING:
+                if (x+dx, y+dy) in cells:
+                    del self.routes[i]
+                    del self.cells[i]
+                    self.search()
+                    break
+
+    def refresh(self):
+        """Collect any routes that have come in."""
+        for i in self.requests[:]:
+            if i.done:
+                self.requests.remove(i)
+                if i.path and not i.path.waypoints in [route.waypoints for route in self.routes]:
+                    self.routes.append(i.path)
+                    self.cells.append(set(i.path))
+
+    def route(self):
+        """The next route in turn, or None if none are ready yet."""
+        self.refresh()
+        if not self.routes:
+            return None
+        self.next = (self.next + 1) % len(self.routes)
+        return self.routes[self.next]
+
+class CallerStats(object):
+    """PathTelemetry's running totals for one kind of caller."""
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.expanded = 0
+        self.open_peak = 0 #the biggest open list any of its searches needed
+        self.failed = 0
+        self.cancelled = 0 #dropped from the queue before they finished, their nodes still count
+        self.seconds = 0.0
+        self.frame_peak = 0 #most calls in any one frame
+
+    def calls_per_frame(self, frames):
+        return self.calls * 1.0 / (frames or 1)
+
+class PathTelemetry(object):
+    """Counts what the pathfinder gets asked, broken down by the class of whoever asked
+       (Worker, BattleBot, RouteBank...), so we can see which AI loop is flooding it.
+       MapGrid keeps one as telemetry - read it with report() while the game runs,
+       or dump() it to a file. Callers pass themselves as caller=, anything that
+       doesn't is counted as "other"."""
+    def __init__(self, frames=TELEMETRY_FRAMES):
+        self.callers = {} #name -> CallerStats
+        self.frames = 0
+        self.this_frame = {} #name -> calls so far this frame
+        self.keep = frames
+        self.recent = deque() #this_frame of the last keep frames
+
+    def caller_name(self, caller):
+        if caller == None:
+            return "other"
+        if isinstance(caller, str):
+            return caller
+        return caller.__class__.__name__
+
+    def stats(self, name):
+        if not name in self.callers:
+            self.callers[name] = CallerStats(name)
+        return self.callers[name]
+
+    def called(self, name):
+        """Count a call, results come in through finished."""
+        stats = self.stats(name)
+        stats.calls += 1
+        self.this_frame[name] = self.this_frame.get(name, 0) + 1
+        if self.this_frame[name] > stats.frame_peak:
+            stats.frame_peak = self.this_frame[name]
+
+    def finished(self, name, expanded, open_peak, failed, seconds):
+        stats = self.stats(name)
+        stats.expanded += expanded
+        stats.open_peak = max(stats.open_peak, open_peak)
+        if failed:
+            stats.failed += 1
+        stats.seconds += seconds
+
+    def cancelled(self, name, expanded, seconds):
+        """Count a queued call nobody waited for - whatever searching it got done still counts."""
+        stats = self.stats(name)
+        stats.cancelled += 1
+        stats.expanded += expanded
+        stats.seconds += seconds
+
+    def next_frame(self):
+        self.recent.append(self.this_frame)
+        if len(self.recent) > self.keep:
+            self.recent.popleft()
+        self.this_frame = {}
+        self.frames += 1
+
+    def report(self):
+        """Return the CallerStats of everyone who has asked for a path, busiest first."""
+        return sorted(self.callers.values(), key=lambda i: -i.calls)
+
+    def recent_calls(self, name=None):
+        """Calls per frame over the last few frames, by everyone or just name."""
+        if name:
+            return [i.get(name, 0) for i in self.recent]
+        return [sum(i.values()) for i in self.recent]
+
+    def dump(self, filename):
+        f = open(filename, "w")
+        f.write("%d frames\n" % self.frames)
+        f.write("%-12s %7s %9s %9s %10s %9s %7s %9s %9s\n" % (
+            "caller", "calls", "calls/fr", "peak/fr", "expanded", "open peak", "failed", "cancelled", "ms"))
+        for i in self.report():
+            f.write("%-12s %7d %9.2f %9d %10d %9d %7d %9d %9.1f\n" % (
+                i.name, i.calls, i.calls_per_frame(self.frames), i.frame_peak, i.expanded,
+                i.open_peak, i.failed, i.cancelled, i.seconds*1000.0))
+        f.write("calls in the last %d frames: %s\n" % (len(self.recent), self.recent_calls()))
+        f.close()
+
 class MapGrid(object):
     """This object stores all map related stuff, as well as "open"
        spaces for towers/traps to be built on..."""
-    def __init__(self, game):
-        self.size = (800/20, 500/20)
+    def __init__(self, game, size=None, seed=None, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.size = size or (MAP_SIZE[0]/cell_size, MAP_SIZE[1]/cell_size) #in cells
+        self.pixel_size = (self.size[0]*cell_size, self.size[1]*cell_size)
+        self.enemy_area = ENEMY_AREA/cell_size
+        self.hero_area = HERO_AREA/cell_size
+        self.rng = random.Random(seed) #hands out the seeds for path searches, see search_seed
 
         self.game = game
 
+        self.flow_fields = {}
+        self.placement_impacts = {} #placement_impact answers for the current version
+        self.placement_version = None
+        self.cluster_graphs = {} #avoid_towers -> ClusterGraph, made on first long search
+        self.route_banks = {} #(start, end) -> RouteBank
+
+        self.version = 0 #bumped whenever a cell changes, so cached paths know when they are stale
+        self.requests = deque() #queued PathRequests, worked through by update_requests
+        self.solver_batches = deque() #(result, requests, version) for batches out at the solver pool
+        self.path_cache = {} #key -> (last used, path)
+        self.cache_order = deque() #(last used, key), oldest first - skip any that were used again since
+        self.cache_tick = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.frame_paths = {} #this frame's seedless calculate_path results, see calculate_path and next_frame
+        self.frame_requests = {} #this frame's queued requests, so identical ones can follow them
+        self.searches_saved = 0 #searches skipped because an identical one ran the same frame
+        self.telemetry = PathTelemetry()
+        self.last_expanded = 0 #nodes the last search expanded
+        self.last_open_peak = 0 #and the most it had on its open list at once
+
         self.make_base_grid()
-        self.fill((0,0), (10, 10)) #fill in the enemy area so we can't build there!
-        self.fill((self.size[0]-8, self.size[1]-8), (8,8))
+        self.arena = SearchArena(self.size[0] * self.size[1])
+        self.request_arena = SearchArena(self.size[0] * self.size[1]) #for the one queued search in flight
+        self.back_arena = SearchArena(self.size[0] * self.size[1]) #the end's half of a bidirectional search
+        self.fill((0,0), (self.enemy_area,)*2) #fill in the enemy area so we can't build there!
+        self.fill((self.size[0]-self.hero_area, self.size[1]-self.hero_area), (self.hero_area,)*2)
 
         self.group_seed = 0
         self.seed_next = False
@@ -25,14 +1178,24 @@ class MapGrid(object):
                0: empty
                1: occupied, non-movement-blocking
                2: occupied, blocking
-               3: occupied, blocking, bugs should avoid!"""
-        grid = []
-        for x in xrange(self.size[0]):
-            grid.append([])
-            for y in xrange(self.size[1]):
-                grid[-1].append(0)
+               3: occupied, blocking, bugs should avoid!
+           The grid is one flat array of bytes, row by row, so cell (x, y) lives at
+           index y*width + x - see index()."""
+        self.grid = array.array('B', [0]) * (self.size[0] * self.size[1])
 
-        self.grid = grid
+        #proximity counts, kept up to date by set() so searches never have to scan around a cell
+        self.near = array.array('B', [0]) * (self.size[0] * self.size[1]) #occupied cells within 1
+        self.tower_near = array.array('B', [0]) * (self.size[0] * self.size[1]) #towers (3) within 1
+        self.tower_avoid = array.array('B', [0]) * (self.size[0] * self.size[1]) #towers (3) within 3
+
+        #connected walkable areas - cells you can walk between share a label, blocked cells are 0
+        self.regions = [1] * (self.size[0] * self.size[1])
+        self.region_sizes = {1:self.size[0] * self.size[1]}
+        self.next_region = 2
+
+    def index(self, pos):
+        """Return the position of a cell in the flat grid."""
+        return pos[1]*self.size[0] + pos[0]
 
     def fill(self, start, size, code=1):
         """Fill area from start to start + size with occupied stuffs..."""
@@ -46,59 +1209,489 @@ class MapGrid(object):
     def set(self, pos, code=1):
         if self.out_of_bounds(pos):
             return
-        self.grid[pos[0]][pos[1]] = code
+        i = pos[1]*self.size[0] + pos[0]
+        old = self.grid[i]
+        self.grid[i] = code
+
+        if old != code:
+            self.version += 1
+            for i in self.route_banks.values():
+                i.cell_changed(pos)
+            for i in self.cluster_graphs.values():
+                for p in self.group((pos[0]-1, pos[1]-1), (3, 3)):
+                    i.mark_dirty(p)
+        if (old >= 2) != (code >= 2):
+            if code >= 2:
+                self.region_blocked(pos)
+            else:
+                self.region_opened(pos)
+        if bool(old) != bool(code):
+            self.spread(self.near, pos, 1, (1 if code else -1))
+        if (old == 3) != (code == 3):
+            self.spread(self.tower_near, pos, 1, (1 if code == 3 else -1))
+            self.spread(self.tower_avoid, pos, 3, (1 if code == 3 else -1))
+        if ((old >= 2) != (code >= 2) or (old == 3) != (code == 3)) and self.flow_fields:
+            #walkability or tower proximity changed somewhere in here
+            changed = self.group((pos[0]-1, pos[1]-1), (3, 3))
+            for i in self.flow_fields.values():
+                i.cells_changed(changed)
+
+    def spread(self, field, pos, radius, amount):
+        """Add amount to every cell of field within radius of pos."""
+        numcols, numrows = self.size
+        for y in xrange(max(pos[1]-radius, 0), min(pos[1]+radius+1, numrows)):
+            for x in xrange(max(pos[0]-radius, 0), min(pos[0]+radius+1, numcols)):
+                field[y*numcols + x] += amount
+
+    def walkable(self, pos):
+        return not self.out_of_bounds(pos) and self.grid[pos[1]*self.size[0] + pos[0]] < 2
+
+    def relabel(self, pos, old, new):
+        """Flood the cells labelled old that connect to pos with new, returning how many there were."""
+        regions = self.regions
+        numcols, numrows = self.size
+        index = pos[1]*numcols + pos[0]
+        regions[index] = new
+        stack = [index]
+        count = 0
+        while stack:
+            index = stack.pop()
+            count += 1
+            x = index % numcols
+            y = index / numcols
+            for newx, newy in ((x, y-1), (x-1, y), (x+1, y), (x, y+1)):
+                if newx < 0 or newx >= numcols or newy < 0 or newy >= numrows:
+                    continue
+                newindex = newy*numcols + newx
+                if regions[newindex] == old:
+                    regions[newindex] = new
+                    stack.append(newindex)
+        return count
+
+    def region_opened(self, pos):
+        """pos became walkable - join it to the regions around it, merging them into the biggest."""
+        x, y = pos
+        labels = []
+        for cell in ((x, y-1), (x-1, y), (x+1, y), (x, y+1)):
+            if self.walkable(cell):
+                label = self.regions[self.index(cell)]
+                if not label in labels:
+                    labels.append(label)
+
+        if not labels:
+            label = self.next_region
+            self.next_region += 1
+            self.region_sizes[label] = 0
+        else:
+            label = max(labels, key=self.region_sizes.get)
+            for cell in ((x, y-1), (x-1, y), (x+1, y), (x, y+1)):
+                if self.walkable(cell):
+                    old = self.regions[self.index(cell)]
+                    if old != label:
+                        self.region_sizes[label] += self.relabel(cell, old, label)
+                        del self.region_sizes[old]
+
+        self.regions[self.index(pos)] = label
+        self.region_sizes[label] += 1
+
+    def region_blocked(self, pos):
+        """pos became blocked - if that cut its region in two, give each part its own label."""
+        x, y = pos
+        label = self.regions[self.index(pos)]
+        self.regions[self.index(pos)] = 0
+        self.region_sizes[label] -= 1
+        if not self.region_sizes[label]:
+            del self.region_sizes[label]
+
+        ring = [self.walkable((x+dx, y+dy)) for dx, dy in RING]
+        if all(ring):
+            return
+        #walk round the cells around pos - if the sides we could leave by are all on one unbroken
+        #stretch of walkable cells they are still joined up, and nothing else can have changed
+        runs = set()
+        run = 0
+        first = ring.index(False)
+        for i in xrange(first+1, first+9):
+            if not ring[i % 8]:
+                run += 1
+            elif i % 2: #the odd ring cells are the sides
+                runs.add(run)
+        if len(runs) <= 1:
+            return
+
+        sides = [cell for cell in ((x, y-1), (x-1, y), (x+1, y), (x, y+1)) if self.walkable(cell)]
+        for cell in sides[:-1]:
+            if self.regions[self.index(cell)] == label:
+                new = self.next_region
+                self.next_region += 1
+                self.region_sizes[new] = self.relabel(cell, label, new)
+                self.region_sizes[label] -= self.region_sizes[new]
+        #whatever is left with the old label is the last side's part
+        if not self.region_sizes[label]:
+            del self.region_sizes[label]
+
+    def regions_around(self, pos):
+        """The regions a path to or from pos could use - its own, or if it is blocked the ones beside it."""
+        if self.out_of_bounds(pos):
+            return set()
+        label = self.regions[self.index(pos)]
+        if label:
+            return set([label])
+        x, y = pos
+        return set([self.regions[self.index(cell)] for cell in ((x, y-1), (x-1, y), (x+1, y), (x, y+1))
+                    if self.walkable(cell)])
+
+    def reachable(self, start, end):
+        """Whether there is any path from start to end, straight off the region labels.
+           Like the searches, a blocked start or end is fine as long as it has an open side."""
+        if abs(start[0]-end[0]) + abs(start[1]-end[1]) <= 1:
+            return True
+        return bool(self.regions_around(start) & self.regions_around(end))
 
     def out_of_bounds(self, pos):
         return pos[0] < 0 or pos[0] >= self.size[0] or pos[1] < 0 or pos[1] >= self.size[1]
 
     def is_open(self, pos):
         if not self.out_of_bounds(pos):
-            return self.grid[pos[0]][pos[1]] == 0
+            return self.grid[pos[1]*self.size[0] + pos[0]] == 0
         return True
 
     def is_blocking(self, pos):
-        return self.grid[pos[0]][pos[1]] == 2
+        return self.grid[pos[1]*self.size[0] + pos[0]] == 2
 
     def screen_to_grid(self, pos):
         x, y = pos
-        x = (int(x/20) if x else 0)
-        y = (int(y/20) if y else 0)
+        x = (int(x/self.cell_size) if x else 0)
+        y = (int(y/self.cell_size) if y else 0)
         return x, y
 
     def grid_to_screen(self, pos):
+        """The screen position of a cell's top left corner."""
         x, y = pos
-        #TODO: why do we need to be adding 10 here - obviously because it is wrong on screen otherwise, but why?
-        x = x * 20
-        y = y * 20
+        x = x * self.cell_size
+        y = y * self.cell_size
         return x, y
 
+    def cell_center(self, pos):
+        """The screen position of the middle of a cell, where units walk to."""
+        x, y = self.grid_to_screen(pos)
+        return x + self.cell_size/2, y + self.cell_size/2
+
+    def cell_midbottom(self, pos):
+        """The screen position of the middle of a cell's bottom edge, where buildings stand."""
+        x, y = self.grid_to_screen(pos)
+        return x + self.cell_size/2, y + self.cell_size
+
+    def midbottom_to_grid(self, pos):
+        """The cell a building standing at pos (see cell_midbottom) is on."""
+        return self.screen_to_grid((pos[0], pos[1] - self.cell_size/2))
+
+    def make_path(self, cells, avoid_towers=False):
+        waypoints = self.smooth_path(cells, avoid_towers)
+        return Path(waypoints, [self.cell_center(i) for i in waypoints])
+
+    def smooth_path(self, cells, avoid_towers=False):
+        """Cut a cell by cell path down to the waypoints a unit needs to walk it.
+           Straight runs collapse to their ends, then each waypoint skips ahead to the
+           furthest one it can walk straight to (see clear_walk). Tower avoiding paths
+           don't take shortcuts past anything the search was keeping away from."""
+        if len(cells) <= 2:
+            return list(cells)
+
+        turns = [cells[0]]
+        for i in xrange(1, len(cells)-1):
+            a, b, c = cells[i-1], cells[i], cells[i+1]
+            if (b[0]-a[0], b[1]-a[1]) != (c[0]-b[0], c[1]-b[1]):
+                turns.append(b)
+        turns.append(cells[-1])
+
+        on_path = set(cells)
+        waypoints = [turns[0]]
+        i = 0
+        while i < len(turns)-1:
+            j = i+1 #the next turn we can always get to, it is how the search came
+            while j+1 < len(turns) and self.clear_walk(turns[i], turns[j+1], cells[-1], on_path, avoid_towers):
+                j += 1
+            waypoints.append(turns[j])
+            i = j
+        return waypoints
+
+    def clear_walk(self, start, end, goal, on_path, avoid_towers):
+        """Whether a unit can get from start to end in one go. Units walk diagonally until
+           they line up with where they are going and then straight on, so follow that, and
+           don't let the diagonal bit cut past a blocked corner. goal may be blocked, and
+           with avoid_towers only cells on_path may be next to anything."""
+        def ok(pos):
+            if pos == goal:
+                return True
+            if not self.walkable(pos):
+                return False
+            return not (avoid_towers and self.near[self.index(pos)] and not pos in on_path)
+
+        x, y = start
+        endx, endy = end
+        dx = cmp(endx, x)
+        dy = cmp(endy, y)
+        while (x, y) != end:
+            if x != endx and y != endy:
+                if not (ok((x+dx, y)) and ok((x, y+dy)) and ok((x+dx, y+dy))):
+                    return False
+                x += dx
+                y += dy
+            else:
+                if x != endx:
+                    x += dx
+                else:
+                    y += dy
+                if not ok((x, y)):
+                    return False
+        return True
+
     def screen_to_screen(self, pos):
         """This just makes sure the screen pos is moved to the nearest grid pos..."""
         return self.grid_to_screen(self.screen_to_grid(pos))
 
     def empty_around(self, pos):
         """Return wether there are no filled spaces +/- 1 of pos."""
+        if not self.out_of_bounds(pos):
+            return not self.near[pos[1]*self.size[0] + pos[0]]
         for x in xrange(pos[0]-1, pos[0]+2):
             for y in xrange(pos[1]-1, pos[1]+2):
                 if not self.out_of_bounds((x, y)):
-                    if self.grid[x][y]:
+                    if self.grid[y*self.size[0] + x]:
                         return False
         return True
 
     def should_avoid(self, pos):
-        """Return whether there are no filled spaces +/- 1 of pos."""
+        """Return whether there are any towers +/- 3 of pos."""
+        if not self.out_of_bounds(pos):
+            return bool(self.tower_avoid[pos[1]*self.size[0] + pos[0]])
         for x in xrange(pos[0]-3, pos[0]+4):
             for y in xrange(pos[1]-3, pos[1]+4):
                 if not self.out_of_bounds((x, y)):
-                    if self.grid[x][y] == 3:
+                    if self.grid[y*self.size[0] + x] == 3:
                         return True
         return False
 
-    def calculate_path(self, start, end, avoid_towers=True, very_random=True):
+    def bank_route(self, start, end):
+        """Hand out one of the ready made routes from start to end, or None if there are none yet.
+           The first call for a pair starts their RouteBank off."""
+        if not (start, end) in self.route_banks:
+            self.route_banks[start, end] = RouteBank(self, start, end)
+        return self.route_banks[start, end].route()
+
+    def flow_step(self, pos, goal):
+        """Return the next cell to move to from pos toward goal, using the shared
+           flow field for that goal, or None if there is nowhere to go."""
+        if not goal in self.flow_fields:
+            self.flow_fields[goal] = FlowField(self, goal)
+        return self.flow_fields[goal].next_step(pos)
+
+    def hive_route(self):
+        """The (hive, hero) cells the insects travel between."""
+        return (self.screen_to_grid(self.game.hive.rect.center),
+                self.screen_to_grid(self.game.hero.rect.center))
+
+    def placement_impact(self, pos, code=3):
+        """What putting code down on pos would do to the insects' trip from the hive to the
+           hero, without putting it there: returns (cuts, extra) - whether it would leave
+           them no way through, and how much dearer their best route gets (in steps, with
+           steps next to a tower costing TOWER_AVOID_COST more, like the flow field).
+           The game only asks about cells empty_around has passed, and those can't cut the
+           route, so there cuts is only a guard.
+
+           Placing something only ever makes cells dearer, so the distances already in the
+           hero's flow field never overestimate and make an exact a* heuristic: the search
+           walks straight down the field and only has to spread out around pos."""
+        if self.placement_version != self.version: #the hover answers only last until the grid changes
+            self.placement_impacts = {}
+            self.placement_version = self.version
+        key = (pos, code)
+        if key in self.placement_impacts:
+            return self.placement_impacts[key]
+
+        start, goal = self.hive_route()
+        impact = False, 0
+        if code >= 2 and not self.out_of_bounds(pos) and self.grid[self.index(pos)] < 2 and \
+           not self.out_of_bounds(start):
+            if not goal in self.flow_fields:
+                self.flow_fields[goal] = FlowField(self, goal)
+            field = self.flow_fields[goal]
+            if field.pending or field.queue:
+                field.repair()
+            if field.g[self.index(start)] < INFINITY: #nothing to cut if there is no route already
+                impact = self.search_impact(field, start, pos, code)
+        self.placement_impacts[key] = impact
+        return impact
+
+    def search_impact(self, field, start, pos, code):
+        """Run the search for placement_impact, bypassing its cache."""
+        h = field.g
+        grid = self.grid
+        tower_near = self.tower_near
+        numcols = self.size[0]
+        blocked = self.index(pos) if code >= 2 else -1
+        dearer = {}
+        if code == 3:
+            for cell in self.group((pos[0]-1, pos[1]-1), (3, 3)):
+                index = self.index(cell)
+                if not tower_near[index]:
+                    dearer[index] = True
+
+        startindex = self.index(start)
+        best = {startindex: 0}
+        openlist = [(h[startindex], h[startindex], startindex)]
+        while openlist:
+            f, rest, index = heapq.heappop(openlist)
+            cost = best[index]
+            if index == field.goal_index:
+                return False, cost - h[startindex]
+            if cost + rest < f:
+                continue #stale, we found a cheaper way here since
+            for n in field.neighbours(index):
+                if h[n] == INFINITY or n == blocked or (grid[n] >= 2 and n != field.goal_index):
+                    continue
+                step = 1
+                if n in dearer or tower_near[n]:
+                    step += TOWER_AVOID_COST
+                newcost = cost + step
+                if newcost < best.get(n, INFINITY):
+                    best[n] = newcost
+                    heapq.heappush(openlist, (newcost + h[n], h[n], n))
+        return True, INFINITY
+
+    def cluster_graph(self, avoid_towers=True):
+        """Return the ClusterGraph for avoid_towers, starting one if there isn't one yet.
+           A new graph isn't ready until update_requests (or its refresh) has built it."""
+        if not avoid_towers in self.cluster_graphs:
+            self.cluster_graphs[avoid_towers] = ClusterGraph(self, avoid_towers)
+        return self.cluster_graphs[avoid_towers]
+
+    def hierarchical_path(self, start, end, avoid_towers=True):
+        """Find a path with the cluster graph instead of a full grid search - much
+           cheaper for long trips on big maps, but the paths are not randomized.
+           While the graph is still being built or rebuilt this is a plain a* search."""
+        graph = self.cluster_graph(avoid_towers)
+        if not graph.ready():
+            return self.search_path(start, end, avoid_towers, False)
+        path = graph.find_path(start, end)
+        self.last_expanded = graph.expanded
+        return path
+
+    def bidirectional_path(self, start, end, avoid_towers=True):
+        """Search from both ends at once until the two searches meet in the middle - on long
+           trips each side only has to get about halfway. With avoid_towers stepping next
+           to anything costs NEAR_AVOID_COST more, as it does for a*, but the paths are not
+           randomized - the two sides have to agree on what every step costs to meet."""
+        blockedmap = self.grid
+        near = self.near
+        numcols, numrows = self.size
+        startindex = start[1]*numcols + start[0]
+        endindex = end[1]*numcols + end[0]
+        self.last_expanded = 0
+        if start == end:
+            return [start]
+
+        #each side: arena, the cell it is heading for, and the one it came from. Both sides share
+        #one heuristic, half the distance still to go less half the distance come - kept doubled,
+        #so a node's key is twice its cost plus that - which lets us stop as soon as the two best
+        #keys add up to twice the cheapest path found
+        sides = []
+        for arena, origin, target in ((self.arena, start, end), (self.back_arena, end, start)):
+            arena.reset()
+            index = origin[1]*numcols + origin[0]
+            arena.stamp[index] = arena.generation
+            arena.inlist[index] = INOPENLIST
+            arena.movecost[index] = 0
+            arena.parent[index] = -1
+            arena.openlist.push(index, abs(target[0]-origin[0]) + abs(target[1]-origin[1]))
+            sides.append((arena, target, origin))
+        forward, backward = sides
+
+        best = INFINITY #cheapest full path found so far
+        meet = -1
+
+        while len(forward[0].openlist) and len(backward[0].openlist):
+            if forward[0].openlist.peek()[0] + backward[0].openlist.peek()[0] >= best*2:
+                break
+
+            #grow whichever side has the lower best key
+            if forward[0].openlist.peek()[0] <= backward[0].openlist.peek()[0]:
+                (arena, target, origin), other = forward, backward[0]
+                reverse = False
+            else:
+                (arena, target, origin), other = backward, forward[0]
+                reverse = True
+
+            cost, index = arena.openlist.pop()
+            self.last_expanded += 1
+            arena.inlist[index] = INCLOSEDLIST
+            x = index % numcols
+            y = index / numcols
+            movecost = arena.movecost[index]
+            targetx, targety = target
+            originx, originy = origin
+
+            for newx, newy in ((x, y-1), (x-1, y), (x+1, y), (x, y+1)):
+                if newx < 0 or newx >= numcols or newy < 0 or newy >= numrows:
+                    continue
+                newindex = newy*numcols + newx
+
+                #moves go from the forward side's cell into the backward side's, and cost by the cell stepped into
+                if reverse:
+                    into = index
+                    if blockedmap[newindex] >= 2 and newindex != startindex:
+                        continue
+                else:
+                    into = newindex
+                    if blockedmap[newindex] >= 2 and newindex != endindex:
+                        continue
+                step = 1
+                if avoid_towers and near[into]:
+                    step += NEAR_AVOID_COST
+                newmovecost = movecost + step
+
+                key = (newmovecost*2 + abs(targetx - newx) + abs(targety - newy)
+                       - abs(originx - newx) - abs(originy - newy))
+                if arena.stamp[newindex] != arena.generation:
+                    arena.stamp[newindex] = arena.generation
+                    arena.inlist[newindex] = INOPENLIST
+                    arena.movecost[newindex] = newmovecost
+                    arena.parent[newindex] = index
+                    arena.openlist.push(newindex, key)
+                elif arena.inlist[newindex] == INOPENLIST and newmovecost < arena.movecost[newindex]:
+                    arena.openlist.decrease(newindex, key)
+                    arena.movecost[newindex] = newmovecost
+                    arena.parent[newindex] = index
+                else:
+                    continue
+
+                if other.stamp[newindex] == other.generation and newmovecost + other.movecost[newindex] < best:
+                    best = newmovecost + other.movecost[newindex]
+                    meet = newindex
+
+        if meet == -1:
+            return False
+
+        #walk back to the start from where they met, then on to the end
+        path = []
+        index = meet
+        while index != -1:
+            path.append((index%numcols, index/numcols))
+            index = forward[0].parent[index]
+        path.reverse()
+        index = backward[0].parent[meet]
+        while index != -1:
+            path.append((index%numcols, index/numcols))
+            index = backward[0].parent[index]
+        return path
+
+    def calculate_path(self, start, end, avoid_towers=True, very_random=True, hierarchical=False, seed=None,
+                       bidirectional=False, caller=None):
         """Calculates a path using an a* like algorithm.
         @param start: coordinates of start
         @param end: coordinates of end
-        @returns: a list of coordinates for the path, or false if no path was found
+        @returns: a Path of coordinates, shared with anyone else who asked - or False if no path was found
         @todo:  return multiple paths? variation?
 
         Used this for reference: http://www.gamedev.net/reference/articles/article2003.asp
@@ -117,10 +1710,35 @@ class MapGrid(object):
         really depends on how we implement the actual unit movement, so tweak the
         constants below for that as necessary. We can also tweak the movement cost
         for each direction if needed via the adjacent list.
-        """
 
-        blockedmap = self.grid
+        Finished searches are kept in a small LRU cache keyed on the grid version,
+        so asking for the same path again before the map changes is just a lookup.
 
+        hierarchical=True goes through hierarchical_path, which is much cheaper for long
+        trips on big grids but doesn't randomize its paths. bidirectional=True searches
+        from both ends with bidirectional_path instead.
+
+        The random edge costs come from seed, which is part of the cache key - pass the same
+        one to get the same route (a unit's own stream keeps its paths its own), or leave it
+        out and search_seed picks one, now and then the same for a few searches in a row.
+        Calls that leave it out and ask for the same trip in the same frame (between two
+        next_frame calls) all get the first one's path though, rather than a search each.
+
+        Goals walled off from start are turned down straight away off the region labels
+        (see reachable) instead of searching every cell we can get to first.
+
+        Pass caller (normally self) to have the call counted against its class in telemetry.
+        """
+        name = self.telemetry.caller_name(caller)
+        self.telemetry.called(name)
+        self.last_expanded = self.last_open_peak = 0
+        t = time.time()
+        path = self.find_path(start, end, avoid_towers, very_random, hierarchical, seed, bidirectional)
+        self.telemetry.finished(name, self.last_expanded, self.last_open_peak, not path, time.time() - t)
+        return path
+
+    def find_path(self, start, end, avoid_towers, very_random, hierarchical, seed, bidirectional):
+        """Everything calculate_path does bar the telemetry."""
         # type checking
         tupletype = type(())
         listtype = type([])
@@ -129,136 +1747,333 @@ class MapGrid(object):
         if type(end) != tupletype or len(end) != 2:
             raise Exception('End parameter must be a 2 tuple representing the coordinates of the end position')
 
-        # some useful info
+        if not self.reachable(start, end):
+            return False
+
+        if bidirectional:
+            hierarchical = False
+
+        frame_key = None
+        if seed == None:
+            frame_key = (start, end, avoid_towers, very_random, hierarchical, bidirectional, self.version)
+            if frame_key in self.frame_paths:
+                self.searches_saved += 1
+                return self.frame_paths[frame_key]
+        seed = self.path_seed(avoid_towers, very_random, hierarchical or bidirectional, seed)
+
+        key = (start, end, avoid_towers, very_random, hierarchical, bidirectional, seed, self.version)
+        path = self.cached_path(key)
+        if path == None:
+            if bidirectional:
+                path = self.bidirectional_path(start, end, avoid_towers)
+                self.last_open_peak = self.arena.openlist.peak + self.back_arena.openlist.peak
+            elif hierarchical:
+                path = self.hierarchical_path(start, end, avoid_towers)
+            else:
+                path = self.search_path(start, end, avoid_towers, very_random, seed=seed)
+            path = self.cache_path(key, path, avoid_towers)
+            if frame_key:
+                self.frame_paths[frame_key] = path
+
+        return path
+
+    def nearest_path(self, start, goals, caller=None):
+        """Find whichever of the goal cells is the fewest steps from start with one breadth first
+           search, rather than a search per goal. Returns (goal, path), or (None, False) if none of
+           them can be reached. Like calculate_path, goals may be blocked cells - and caller is
+           who to count it against."""
+        name = self.telemetry.caller_name(caller)
+        self.telemetry.called(name)
+        self.last_expanded = 0
+        t = time.time()
+        goal, path = self.find_nearest(start, goals)
+        self.telemetry.finished(name, self.last_expanded, 0, not path, time.time() - t)
+        return goal, path
+
+    def find_nearest(self, start, goals):
+        """Everything nearest_path does bar the telemetry."""
+        goals = set([i for i in goals if self.reachable(start, i)])
+        if not goals:
+            return None, False
+        key = ("nearest", start, tuple(sorted(goals)), self.version)
+        path = self.cached_path(key)
+        if path == None:
+            path = self.cache_path(key, self.search_nearest(start, goals))
+        if path:
+            return path[-1], path
+        return None, False
+
+    def search_nearest(self, start, goals):
+        """Run the breadth first search for nearest_path, bypassing the cache."""
+        blockedmap = self.grid
         numcols, numrows = self.size
-
-        # create open and closed lists
-        openlist = []       # cost, coords, parentcoords
-        closedlist = []
-        inlist = [ [-1 for j in xrange(numrows)] for i in xrange(numcols)]
-        nodelist = [ [(0,0, (abs(end[1]-i) + abs(end[0]-j))) for j in xrange(numrows)] for i in xrange(numcols)]
-        parentlist = [ [(-1,-1) for j in xrange(numrows)] for i in xrange(numcols)]
-        # todo: do I really need all these lists? this got so messy trying to keep object overhead out of it...
-
-        # add starting location to open list-- hopefully it is on our map...
-        openlist.append( (-1, start, False))
-        parentlist[start[0]][start[1]] = False
-        inlist[start[0]][start[1]] = INOPENLIST
-
-        # loop through map until path is found
-        if self.seed_next:
-            random.seed(self.group_seed)
-            self.seed_next = False
-        else:
-            group = not bool(random.randrange(5))
-            if group:
-                self.seed_next = True
-                self.group_seed += 1
-                random.seed(self.group_seed)
-        r = random.randrange
-
-        if very_random:
-            ru = 50
-        else:
-            ru = 10
-
-        adjacent = [(0,-1, 1+r(ru)), (-1, 0, 1+r(ru)), (1, 0, 1+r(ru)), (0, 1, 1+r(ru))]
-
-        swap_adj = 0
-
-        while True:
-            swap_adj += 1
-            if swap_adj > 25:
-                swap_adj = 0
-                adjacent = [(0,-1, 1+r(ru)), (-1, 0, 1+r(ru)), (1, 0, 1+r(ru)), (0, 1, 1+r(ru))]
-            # if open heap is empty, no path is available
-            if len(openlist) == 0:
-                return False
-
-            # pop lowest open node from the heap
-            cost, coordinates, parentcoordinates = heapq.heappop(openlist)
-            costs = nodelist[coordinates[0]][coordinates[1]]
-
-            # if this is target, build path and return
-            if coordinates == end:
-                path = []
-
-                path.append(end)
-                while parentcoordinates:
-                    path.append(parentcoordinates)
-                    parentcoordinates = parentlist[parentcoordinates[0]][parentcoordinates[1]]
-
-                path.reverse()
-                return path
-
-            # add it to the closed list
-            closedlist.append( (coordinates, parentcoordinates) )
-            inlist[coordinates[0]][coordinates[1]] = INCLOSEDLIST
-
-            # check adjacent nodes
-            for modx, mody, modmovecost in adjacent:
-                newx = coordinates[0] + modx
-                newy = coordinates[1] + mody
-
-
-                # skip if off map
+        goals = set([self.index(i) for i in goals])
+
+        arena = self.arena
+        arena.reset()
+        generation = arena.generation
+        stamp = arena.stamp
+        parentlist = arena.parent
+
+        index = self.index(start)
+        stamp[index] = generation
+        parentlist[index] = -1
+        if index in goals:
+            self.last_expanded = 0
+            return [start]
+
+        openlist = deque([index])
+        self.last_expanded = 0
+        while openlist:
+            index = openlist.popleft()
+            self.last_expanded += 1
+            x = index % numcols
+            y = index / numcols
+            for newx, newy in ((x, y-1), (x-1, y), (x+1, y), (x, y+1)):
                 if newx < 0 or newx >= numcols or newy < 0 or newy >= numrows:
                     continue
-
-                # skip if not walkable
-                if blockedmap[newx][newy] >= 2:
-                    if not (newx, newy) == end:
-                        continue
-
-                # skip if on closed list
-                if inlist[newx][newy] == INCLOSEDLIST:
+                newindex = newy*numcols + newx
+                if stamp[newindex] == generation:
+                    continue
+                if blockedmap[newindex] >= 2 and not newindex in goals:
                     continue
 
-                # if on open list
-                if inlist[newx][newy] == INOPENLIST:
-
-                    # get existing info for this
-                    newcost, newmovecost, newhcost = nodelist[newx][newy]
-
-                    # check if this path is cheaper, update it
-                    if nodelist[newx][newy][1] + modmovecost < newmovecost:
-                        # find node in openlist and update it
-                        for index in xrange(len(openlist)):
-                            if openlist[index][3] == (newx, newy):
-                                updatedmovecost = costs[1] + modmovecost
-                                updatedcost = updatedmovecost + newhcost
-
-                                # update node -- cost, coords, parentcoords
-                                openlist[index] = ( updatedcost, (newx,newy), coordinates)
-                                parentlist[newx][newy] = coordinates
-                                nodelist[newx][newy] = updatedcost, updatedmovecost, newhcost
+                stamp[newindex] = generation
+                parentlist[newindex] = index
+                if newindex in goals:
+                    #the first goal we reach is the nearest one
+                    path = []
+                    while newindex != -1:
+                        path.append((newindex%numcols, newindex/numcols))
+                        newindex = parentlist[newindex]
+                    path.reverse()
+                    return path
+                openlist.append(newindex)
 
-                                # re-sort openlist
-                                if (newx, newy) == end:
-                                    openlist.sort()
+        return False
 
-                                break
+    def cached_path(self, key):
+        """Return the cached result for key, or None if it isn't cached."""
+        if key in self.path_cache:
+            self.cache_hits += 1
+            path = self.path_cache[key][1]
+            self.touch_cache(key, path) #move it back to the fresh end
+            return path
+        self.cache_misses += 1
+        return None
+
+    def touch_cache(self, key, path):
+        self.cache_tick += 1
+        self.path_cache[key] = (self.cache_tick, path)
+        self.cache_order.append((self.cache_tick, key))
+        if len(self.cache_order) > PATH_CACHE_SIZE*4: #mostly stale entries by now, start it over
+            order = [(tick, key) for key, (tick, path) in self.path_cache.items()]
+            order.sort()
+            self.cache_order = deque(order)
+
+    def cache_path(self, key, path, avoid_towers=False):
+        """Store a search result, returning the shared Path that went into the cache."""
+        if not path:
+            path = False
+        elif not isinstance(path, Path):
+            path = self.make_path(path, avoid_towers)
+        self.touch_cache(key, path)
+        while len(self.path_cache) > PATH_CACHE_SIZE:
+            tick, old = self.cache_order.popleft()
+            if old in self.path_cache and self.path_cache[old][0] == tick:
+                del self.path_cache[old]
+        return path
+
+    def request_path(self, start, end, avoid_towers=True, very_random=True, seed=None, caller=None):
+        """Queue a path search instead of running it right now, and return its PathRequest.
+           The search is run a slice at a time by update_requests, so callers should keep
+           doing what they were doing and poll the request until it is done.
+           seed and caller work as they do for calculate_path. A request just like one already
+           queued this frame doesn't get a search of its own, it follows that one and gets its path."""
+        name = self.telemetry.caller_name(caller)
+        self.telemetry.called(name)
+        frame_key = (start, end, avoid_towers, very_random, seed, self.version)
+        leader = self.frame_requests.get(frame_key)
+        if leader and not leader.done:
+            request = PathRequest(start, end, avoid_towers, very_random, leader.seed)
+            request.caller = name
+            leader.followers.append(request)
+            self.searches_saved += 1
+            return request
+
+        seed = self.path_seed(avoid_towers, very_random, False, seed)
+        request = PathRequest(start, end, avoid_towers, very_random, seed)
+        request.caller = name
+        key = request.cache_key(self.version)
+        path = self.cached_path(key)
+        if path != None:
+            request.finish(path)
+        elif not self.reachable(start, end):
+            request.finish(False)
+        else:
+            self.requests.append(request)
+            self.frame_requests[frame_key] = request
+        if request.done:
+            self.request_finished(request)
+        return request
+
+    def request_finished(self, request):
+        """Hand a finished request's numbers to the telemetry, and its followers' - they all
+           get its result, but the search only counts once."""
+        self.telemetry.finished(request.caller, request.expanded, request.open_peak, not request.path,
+                                request.seconds)
+        for i in request.followers:
+            self.telemetry.finished(i.caller, 0, 0, not request.path, 0.0)
+
+    def request_cancelled(self, request):
+        """Hand a dropped request's numbers to the telemetry - the nodes it expanded before
+           everyone stopped waiting were spent all the same."""
+        self.telemetry.cancelled(request.caller, request.expanded, request.seconds)
+        for i in request.followers:
+            self.telemetry.cancelled(i.caller, 0, 0.0)
+
+    def next_frame(self):
+        """Start a new frame: calls from here on don't follow searches from the last one,
+           and telemetry counts them separately. Call this once a frame, before anything asks
+           for a path."""
+        self.frame_paths = {}
+        self.frame_requests = {}
+        self.telemetry.next_frame()
+
+    def update_requests(self, budget=PATH_NODE_BUDGET):
+        """Work through queued path requests until budget nodes have been expanded.
+           Call this once a frame - a search that runs out of budget carries on next time,
+           and one whose grid changed underneath it starts over.
+           Any cluster graphs the grid changed under are rebuilt here too, within
+           CLUSTER_NODE_BUDGET.
+           With a solver pool running the searches are handed off to that instead."""
+        for i in self.cluster_graphs.values():
+            i.refresh(CLUSTER_NODE_BUDGET)
+
+        if solver_pool:
+            self.update_solver_batches()
+            return
 
-                # not on open list
+        spent = 0
+        while self.requests and spent < budget:
+            request = self.requests[0]
+            if not request.wanted():
+                request.steps = None
+                self.requests.popleft()
+                self.request_cancelled(request)
+                continue
+
+            if request.steps == None or request.key[-1] != self.version:
+                request.key = request.cache_key(self.version)
+                path = self.cached_path(request.key)
+                if path != None:
+                    request.finish(path)
                 else:
-                    # calculate costs
-                    newcost, newmovecost, newhcost = nodelist[newx][newy]
-                    newmovecost = costs[1] + modmovecost
-                    newcost = newmovecost + newhcost
-
-                    if avoid_towers:
-                        if not self.empty_around((newx, newy)):
-                            newcost += 750
-
-                    # add to open list
-                    heapq.heappush(openlist, (newcost, (newx,newy), coordinates))
-                    inlist[newx][newy] = INOPENLIST
-                    parentlist[newx][newy] = coordinates
-                    # save cost info
-                    nodelist[newx][newy] = (newcost, newmovecost, newhcost)
-
-
-        return False
+                    request.expanded = 0
+                    request.steps = self.search_steps(request, self.request_arena, PATH_SLICE)
+
+            if not request.done:
+                before = request.expanded
+                t = time.time()
+                for i in request.steps:
+                    if spent + request.expanded - before >= budget:
+                        break
+                request.seconds += time.time() - t
+                request.open_peak = self.request_arena.openlist.peak
+                spent += request.expanded - before
+
+            if request.done:
+                request.steps = None
+                self.requests.popleft()
+                #again with the shared Path, for its followers too
+                request.finish(self.cache_path(request.key, request.path, request.avoid_towers))
+                self.request_finished(request)
+
+    def update_solver_batches(self):
+        """Pick up the batches the solver pool has finished and send it the next ones.
+           Each batch goes with a snapshot of the grid - if the grid has changed by the time
+           it comes back its requests are queued again."""
+        while self.solver_batches and self.solver_batches[0][0].ready():
+            result, batch, version = self.solver_batches.popleft()
+            if version != self.version:
+                self.requests.extendleft(reversed([i for i in batch if i.wanted()]))
+                for request, (path, expanded, open_peak) in zip(batch, result.get()):
+                    if not request.wanted():
+                        request.expanded = expanded
+                        self.request_cancelled(request)
+                continue
+            for request, (path, expanded, open_peak) in zip(batch, result.get()):
+                request.expanded = expanded
+                request.open_peak = open_peak
+                request.finish(self.cache_path(request.key, path, request.avoid_towers))
+                self.request_finished(request) #the time it took is the solver's, not ours
+
+        snapshot = None
+        while self.requests and len(self.solver_batches) < solver_processes:
+            batch = []
+            queries = []
+            while self.requests and len(batch) < SOLVER_BATCH:
+                request = self.requests.popleft()
+                if not request.wanted():
+                    self.request_cancelled(request)
+                    continue
+                request.key = request.cache_key(self.version)
+                path = self.cached_path(request.key)
+                if path != None:
+                    request.finish(path)
+                    self.request_finished(request)
+                    continue
+                batch.append(request)
+                queries.append((request.start, request.end, request.avoid_towers, request.very_random, request.seed))
+
+            if batch:
+                if not snapshot:
+                    snapshot = (self.size, self.grid.tostring(), self.near.tostring())
+                result = solver_pool.apply_async(solve_batch, snapshot + (queries,))
+                self.solver_batches.append((result, batch, self.version))
+
+    def search_path(self, start, end, avoid_towers=True, very_random=True, jump_points=True, seed=None):
+        """Run the actual search for calculate_path, bypassing the cache.
+           jump_points=False sticks to a* even for uniform cost searches."""
+        if seed == None:
+            seed = self.search_seed()
+        request = PathRequest(start, end, avoid_towers, very_random, seed)
+        for i in self.search_steps(request, self.arena, None, jump_points):
+            pass
+        self.last_expanded = request.expanded
+        self.last_open_peak = self.arena.openlist.peak
+        return request.path
+
+    def search_steps(self, request, arena, slice=None, jump_points=True):
+        """Start the search for request inside arena and return its generator - jump point search
+           (jps_steps) when uniform_cost says it can, without a*'s small edge cost jitter, otherwise
+           a* (astar_steps)."""
+        if jump_points and uniform_cost(request):
+            return jps_steps(self.grid, self.size, request, arena, slice)
+        return astar_steps(self.grid, self.near, self.size, request, arena, slice)
+
+    def path_seed(self, avoid_towers, very_random, fixed, seed):
+        """The seed a search should go in the cache under - None when nothing random
+           goes into it (fixed is set for the searches that never randomize, like the
+           hierarchical one), so those searches all share one cache entry."""
+        if fixed or not (avoid_towers or very_random):
+            return None
+        if seed == None:
+            return self.search_seed()
+        return seed
+
+    def search_seed(self):
+        """Every so often a few searches in a row share a seed, so they pick the same edge
+           costs and a group of bugs sets off down the same route - and the later ones just
+           get it out of the cache. Otherwise each search gets a fresh one from our own stream."""
+        if self.seed_next:
+            self.seed_next = False
+            return self.group_seed
+        if not self.rng.randrange(5):
+            self.seed_next = True
+            self.group_seed = self.rng.randrange(INFINITY)
+            return self.group_seed
+        return self.rng.randrange(INFINITY)
 
     def group(self, start, size):
         g = []
@@ -269,66 +2084,104 @@ class MapGrid(object):
                     g.append(p)
         return g
 
-    def make_random(self, blocking, scraps):
+    def make_random(self, blocking, scraps, rng=random):
+        boulders, scraps = self.random_layout(blocking, scraps, rng)
+        self.use_layout(Layout(None, self.size, self.cell_size, boulders, scraps))
+
+    def use_layout(self, layout, scraps=None):
+        """Put the boulders of a Layout down, and the first scraps of its scraps (all of them if None)."""
+        for i in layout.boulders:
+            objects.Boulder(self.game, self.grid_to_screen(i))
+        for i in layout.scraps[:scraps]:
+            objects.Scraps(self.game, self.grid_to_screen(i))
+
+        #get the routes from the hive to the hero going, they should be ready by the first spawn
+        self.bank_route(*self.hive_route())
+
+    def random_layout(self, blocking, scraps, rng=random):
+        """Pick the cells make_random puts its boulders and scraps on, returning (boulders, scraps).
+           They are blocked off on the grid as they go down (so the scraps keep clear of the
+           boulders and each other) but no objects are made, so it works with no game or display
+           around. Each group of cells is shuffled once and dealt out from the top, rather than
+           picking and removing a cell at a time."""
         toprightgroup = self.group((self.size[0]-10, 0), (10,10))
         bottomleftgroup = self.group((0, self.size[1]-10), (10,10))
 
-        mid_group = self.group((self.size[0]/2-5+random.randint(-5, 5), self.size[1]/2-5-random.randint(-5,5)), (5,5))
-        bridge = random.randrange(3) #0=none, 1=center to bl, 2=center to tr
+        mid_group = self.group((self.size[0]/2-5+rng.randint(-5, 5), self.size[1]/2-5-rng.randint(-5,5)), (5,5))
+        bridge = rng.randrange(3) #0=none, 1=center to bl, 2=center to tr
 
         if bridge == 0:
-            bridge_group = []
+            groups = [toprightgroup, bottomleftgroup, mid_group]
         elif bridge == 1:
-            bridge_group = self.group((10, self.size[1]-20), (15, 15))
+            groups = [toprightgroup, bottomleftgroup, mid_group, self.group((10, self.size[1]-20), (15, 15))]
         else:
-            bridge_group = self.group((self.size[0]-20, 10), (15,15))
-
-        if bridge_group:
-            for i in xrange(int(blocking/4)):
-                x = random.choice(toprightgroup)
-                toprightgroup.remove(x)
-                objects.Boulder(self.game, self.grid_to_screen(x))
-
-                x = random.choice(bottomleftgroup)
-                bottomleftgroup.remove(x)
-                objects.Boulder(self.game, self.grid_to_screen(x))
-
-                x = random.choice(mid_group)
-                mid_group.remove(x)
-                objects.Boulder(self.game, self.grid_to_screen(x))
-
-                x = random.choice(bridge_group)
-                bridge_group.remove(x)
-                objects.Boulder(self.game, self.grid_to_screen(x))
-        else:
-            for i in xrange(int(blocking/3)):
-                x = random.choice(toprightgroup)
-                toprightgroup.remove(x)
-                objects.Boulder(self.game, self.grid_to_screen(x))
-
-                x = random.choice(bottomleftgroup)
-                bottomleftgroup.remove(x)
-                objects.Boulder(self.game, self.grid_to_screen(x))
-
-                x = random.choice(mid_group)
-                mid_group.remove(x)
-                objects.Boulder(self.game, self.grid_to_screen(x))
-
+            groups = [toprightgroup, bottomleftgroup, mid_group, self.group((self.size[0]-20, 10), (15,15))]
+
+        boulders = []
+        for group in groups:
+            rng.shuffle(group)
+            count = blocking/len(groups)
+            for x in group:
+                if not count:
+                    break
+                if self.walkable(x): #the middle and the bridge can overlap
+                    self.set(x, 2)
+                    boulders.append(x)
+                    count -= 1
+
+        #scraps go anywhere, but a third of them in the patch just down and right of the middle
+        anywhere = self.group((0, 0), self.size)
+        rng.shuffle(anywhere)
+        middle = self.group((self.size[0]/2+3, self.size[1]/2+3), (5, 5))
+        rng.shuffle(middle)
         s_pos = []
-        reps = 0
-        while len(s_pos) < scraps:
-            if random.randrange(3):
-                x = random.randrange(self.size[0])
-                y = random.randrange(self.size[1])
+        while len(s_pos) < scraps and (anywhere or middle):
+            if (rng.randrange(3) and anywhere) or not middle:
+                x = anywhere.pop()
             else:
-                x = random.randrange(5) + self.size[0]/2 + 3
-                y = random.randrange(5) + self.size[1]/2 + 3
-            if self.empty_around((x, y)):
-                s_pos.append((x, y))
-
-            reps += 1
-            if reps >= 500:
-                break #no good probably
-
-        for i in s_pos:
-            objects.Scraps(self.game, self.grid_to_screen(i))
+                x = middle.pop()
+            if self.empty_around(x):
+                self.set(x, 2)
+                s_pos.append(x)
+        return boulders, s_pos
+
+class Layout(object):
+    """Where the boulders and scraps of a lawn go, made by make_layout
+       (or MapGrid.make_random) and put down with MapGrid.use_layout.
+       size is in cells of cell_size pixels."""
+    def __init__(self, seed, size, cell_size, boulders, scraps):
+        self.seed = seed
+        self.size = size
+        self.cell_size = cell_size
+        self.boulders = boulders
+        self.scraps = scraps
+
+def make_layout(seed, scraps=LAYOUT_SCRAPS, size=None, cell_size=CELL_SIZE):
+    """Lay a lawn out from seed on a scratch grid - the same seed always gives the same
+       lawn. Returns a Layout, or None if the boulders wall the hive off from the hero."""
+    rng = random.Random(seed)
+    grid = MapGrid(None, size, seed, cell_size)
+    boulders, scraps = grid.random_layout(rng.randint(40, 60), scraps, rng)
+    if not grid.reachable((0, 0), (grid.size[0]-1, grid.size[1]-1)): #the hive's corner to the hero's
+        return None
+    return Layout(seed, grid.size, grid.cell_size, boulders, scraps)
+
+def top_up_layouts(count=1):
+    """Try making up to count more layouts for the pool, if it isn't full - for idle moments like the menu."""
+    while count and len(layouts) < LAYOUT_POOL_SIZE:
+        count -= 1
+        layout = make_layout(layout_seeds.randrange(INFINITY))
+        if layout:
+            layouts.append(layout)
+
+def take_layout(size=None, cell_size=CELL_SIZE):
+    """Hand out a ready made layout, making one there and then if the pool has run dry.
+       The pool only holds lawns of the normal size, anything else is always made there and then."""
+    if size or cell_size != CELL_SIZE:
+        layout = None
+        while not layout:
+            layout = make_layout(layout_seeds.randrange(INFINITY), size=size, cell_size=cell_size)
+        return layout
+    while not layouts:
+        top_up_layouts()
+    return layouts.popleft()
@@ -81,27 +81,6 @@ class GameObject(object):
         else:
             self.kill()
 
-    def update_path(self, grid):
-        if hasattr(self, "path"):
-            if self.path and grid in self.path:
-                p = self.path.index(grid)
-                changes = [(grid[0]-1,grid[1]-1), (grid[0],grid[1]-1), (grid[0]+1,grid[1]-1),
-                           (grid[0]+1,grid[1]),                        (grid[0]+1,grid[1]+1),
-                           (grid[0],grid[1]+1), (grid[0]-1,grid[1]+1), (grid[0]-1,grid[1])]
-                if p == 0 or p == len(self.path)-1:
-                    return #useless info now!
-                start = changes.index(self.path[p-1])
-                do = []
-                for i in xrange(8):
-                    i = start+i
-                    if i >= 7:
-                        i = 7 - i
-                    if not changes[i] in (self.path[p+1::]):
-                        do.append(changes[i])
-                    else:
-                        break
-                self.path = self.path[0:p] + do + self.path[p+1::]
-
 class Animation(GameObject):
    
     def __init__(self, game):
@@ -172,7 +151,7 @@ class Hero(GameObject):
         self.image = data.image("data/steps.png")
 
         self.rect = self.image.get_rect()
-        self.rect.bottomright = (800,500) #bottom 100 is the ui bar!
+        self.rect.bottomright = self.game.map_grid.pixel_size #bottom 100 is the ui bar!
 
         self.hero_image = data.image("data/hero.png")
         self.hero_image_hover = data.image("data/hero_hover.png")
@@ -297,7 +276,10 @@ class Hive(GameObject):
                 else:
                     self.fast = False
                 self.counter = 0
-                random.choice(self.choice_list)(self.game, self.level)
+                insect = random.choice(self.choice_list)(self.game, self.level)
+                if not insect.flying:
+                    start, end = self.game.map_grid.hive_route()
+                    insect.follow_route(self.game.map_grid.bank_route(start, end))
                 self.num_spawned += 1
 
         if self.num_spawned >= self.wait_for:
@@ -324,10 +306,8 @@ class BuildTower(GameObject):
         self.image = data.image("data/base.png")
 
         self.rect = self.image.get_rect()
-        x, y = pos
-        x += 10
-        y += 20 #so we can put it at center...
-        self.rect.midbottom = x, y
+        self.cell = self.game.map_grid.screen_to_grid(pos)
+        self.rect.midbottom = self.game.map_grid.cell_midbottom(self.cell) #so we can put it at center...
 
         if to_build == "Base Tower":
             to_build = TowerBase
@@ -347,13 +327,13 @@ class BuildTower(GameObject):
         self.game.update_money()
 
         #set blocking!
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(pos), 1)
+        self.game.map_grid.set(self.cell, 1)
 
         self.built = 0
 
     def kill(self):
         GameObject.kill(self)
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(self.rect.topleft), 0)
+        self.game.map_grid.set(self.cell, 0)
 
 class TowerBase(GameObject):
     ui_icon = "data/tower-base.png" #the ui needs these :S
@@ -381,10 +361,9 @@ class TowerBase(GameObject):
         #and for rendering of the range circle
 
         #set blocking!
-        x, y = pos #this makes sure we don't grab like the center of the tower which is one tile too high!
-        x -= 10
-        y -= 20
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid((x,y)), 3)
+        #this makes sure we don't grab like the center of the tower which is one tile too high!
+        self.cell = self.game.map_grid.midbottom_to_grid(pos)
+        self.game.map_grid.set(self.cell, 3)
 
         self.shot_timer = 0
         self.shot_type = Bullet
@@ -392,9 +371,6 @@ class TowerBase(GameObject):
 
         self.inc_cost()
 
-        for i in self.game.insect_group.objects:
-            i.update_path(self.game.map_grid.screen_to_grid((x, y)))
-
         self.damage = int(self.base_attack)
 
         self.upgrade_types = [MissileTower, LaserTower]
@@ -437,10 +413,7 @@ class TowerBase(GameObject):
 
     def kill(self):
         GameObject.kill(self)
-        x, y = self.rect.midbottom
-        x -= 10
-        y -= 20 #midbottom of grid size
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid((x, y)), 0)
+        self.game.map_grid.set(self.cell, 0)
 
     def render(self):
         GameObject.render(self)
@@ -554,10 +527,9 @@ class LaserTower(TowerBase):
         #and for rendering of the range circle
 
         #set blocking!
-        x, y = pos #this makes sure we don't grab like the center of the tower which is one tile too high!
-        x -= 10
-        y -= 20
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid((x,y)), 3)
+        #this makes sure we don't grab like the center of the tower which is one tile too high!
+        self.cell = self.game.map_grid.midbottom_to_grid(pos)
+        self.game.map_grid.set(self.cell, 3)
 
         self.shot_timer = 0
         self.shot_type = Laser
@@ -565,9 +537,6 @@ class LaserTower(TowerBase):
 
         self.inc_cost()
 
-        for i in self.game.insect_group.objects:
-            i.update_path(self.game.map_grid.screen_to_grid((x, y)))
-
         self.damage = int(self.base_attack)
 
         self.upgrade_types = [ElectroTower]
@@ -736,7 +705,7 @@ class SwoopingBird(Bullet):
 
         self.image = data.image("data/bird.png")
         self.rect = self.image.get_rect()
-        self.rect.topright = 800,0
+        self.rect.topright = game.map_grid.pixel_size[0],0
         self.pos = self.rect.center
 
         self.angle = 0
@@ -754,7 +723,7 @@ class SwoopingBird(Bullet):
 
             self.rect.center = self.pos
 
-            if not self.rect.colliderect(pygame.Rect(0,0,800,500)):
+            if not self.rect.colliderect(pygame.Rect((0,0), self.game.map_grid.pixel_size)):
                 self.kill()
 
         else:
@@ -907,15 +876,13 @@ class Scraps(GameObject):
         self.image = data.image("data/scraps-1.png")
 
         self.rect = self.image.get_rect()
-        x, y = pos
-        x += 10
-        y += 10
-        self.rect.center = x, y
+        self.cell = self.game.map_grid.screen_to_grid(pos)
+        self.rect.center = self.game.map_grid.cell_center(self.cell)
 
         self.cooldown = False
         self.timer = 0
 
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(pos), 2)
+        self.game.map_grid.set(self.cell, 2)
 
     def update(self):
         if self.cooldown:
@@ -932,15 +899,13 @@ class Boulder(GameObject):
         self.image = data.image("data/rock-%s.png"%(random.randrange(2)+1))
 
         self.rect = self.image.get_rect()
-        x, y = pos
-        x += 10
-        y += 10
-        self.rect.center = x, y
+        self.cell = self.game.map_grid.screen_to_grid(pos)
+        self.rect.center = self.game.map_grid.cell_center(self.cell)
 
         self.cooldown = False
         self.timer = 0
 
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(pos), 2)
+        self.game.map_grid.set(self.cell, 2)
 
     def update(self):
         if self.cooldown:
@@ -951,7 +916,7 @@ class Boulder(GameObject):
 
 class RandomTarget(object):
     def __init__(self, game):
-        self.rect = pygame.Rect(0,0,20,20)
+        self.rect = pygame.Rect((0,0), (game.map_grid.cell_size,)*2)
         res = 0
         while 1:
             x = random.randrange(game.map_grid.size[0])
@@ -1015,6 +980,7 @@ class Worker(Animation):
             self.upgrade_level()
 
         self.path = None
+        self.path_request = None
 
     def upgrade_level(self):
         self.max_hp += 7 + int(self.level*.2)
@@ -1037,7 +1003,63 @@ class Worker(Animation):
                 self.used_targets.remove(self.target)
             self.target = None
 
+    def path_to(self, target):
+        """Head for target. If we are already walking somewhere the new path is queued
+           with the map grid and we keep going until it turns up, otherwise we need it
+           right now so search straight away."""
+        goal = self.game.map_grid.screen_to_grid(target.rect.center)
+        if self.path_request:
+            if self.path and self.path_request.end == goal:
+                return #already on its way
+            self.path_request.cancel()
+            self.path_request = None
+
+        #from where we are, not where we're headed - we may be past that by the time the path turns up
+        start = self.game.map_grid.screen_to_grid(self.rect.center)
+        if self.path:
+            self.path_request = self.game.map_grid.request_path(start, goal, False, False, caller=self)
+            self.check_path_request()
+        else:
+            self.follow_path(self.game.map_grid.calculate_path(start, goal, False, False, caller=self))
+
+    def nearest_target(self, targets):
+        """Find whichever of targets is the shortest walk away, returning (target, path),
+           or (None, False) if we can't get to any of them."""
+        goals = {}
+        for i in targets:
+            cell = self.game.map_grid.screen_to_grid(i.rect.center)
+            if not cell in goals:
+                goals[cell] = i
+        if not goals:
+            return None, False
+
+        start = self.game.map_grid.screen_to_grid(self.rect.center)
+        cell, path = self.game.map_grid.nearest_path(start, goals, self)
+        if cell:
+            return goals[cell], path
+        return None, False
+
+    def follow_path(self, path):
+        """Start walking path (a Path, or False), dropping any search we were still waiting on."""
+        if self.path_request:
+            self.path_request.cancel()
+            self.path_request = None
+        self.path = path and path.walk()
+
+    def check_path_request(self):
+        """Swap in our queued path once its search is done."""
+        if self.path_request and self.path_request.done:
+            self.follow_path(self.path_request.path)
+
+    def clear_path(self):
+        self.path = None
+        if self.path_request:
+            self.path_request.cancel()
+            self.path_request = None
+
     def update(self):
+        self.check_path_request()
+
         #Battling first, because we gotta stop movement for that!
         do_hit = []
 
@@ -1060,11 +1082,8 @@ class Worker(Animation):
                     i.hit(self.damage)
             if not (self.target == self.game.hero and self.path):
                 self.target = self.game.hero
-                start = self.game.map_grid.screen_to_grid(self.rect.center)
-                self.path = self.game.map_grid.calculate_path(start, self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
-            else:
-                start = self.path[0]
-                self.path = self.game.map_grid.calculate_path(start, self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                self.clear_path()
+            self.path_to(self.target)
         else:
             self.attack_timer = 0
 
@@ -1073,64 +1092,31 @@ class Worker(Animation):
             old_target = self.target
             if isinstance(self.target, Scraps):
                 self.reset_target() #in case it is a scrap O.o
-            diso = None
-            passed = []
-            for i in self.game.build_tower_group.objects: #will need to add scraps and whatnot later...
-                if not i in self.used_targets:
-                    if not diso:
-                        diso = (i, misc.distance(self.rect.center, i.rect.center))
-                        continue
-                    x = misc.distance(self.rect.center, i.rect.center)
-                    if x < diso[1]:
-                        diso = (i, x)
-                else:
-                    passed.append(i)
-            if not diso:
-                for i in passed:
-                    if not diso:
-                        diso = (i, misc.distance(self.rect.center, i.rect.center))
-                        continue
-                    x = misc.distance(self.rect.center, i.rect.center)
-                    if x < diso[1]:
-                        diso = (i, x)
-
-
-            if not diso:
-                #we need to find some scraps!
-                for i in self.game.scraps_group.objects:
-                    if not i in self.used_targets:
-                        if not i.cooldown:
-                            if not diso:
-                                diso = (i, misc.distance(self.rect.center, i.rect.center))
-                                continue
-                            x = misc.distance(self.rect.center, i.rect.center)
-                            if x < diso[1]:
-                                diso = (i,x)
-
-            if diso:
-                self.target = diso[0]
+            #towers nobody is building yet, then ones somebody is, and if there are no towers we need to find some scraps!
+            towers = self.game.build_tower_group.objects
+            scraps = self.game.scraps_group.objects
+            for targets in ([i for i in towers if not i in self.used_targets],
+                            [i for i in towers if i in self.used_targets],
+                            [i for i in scraps if not (i in self.used_targets or i.cooldown)]):
+                target, path = self.nearest_target(targets)
+                if target:
+                    break
+
+            if target:
+                self.target = target
                 if not self.path or old_target != self.target:
-                    if not self.path:
-                        start = self.game.map_grid.screen_to_grid(self.rect.center)
-                    else:
-                        start = self.path[0]
-                    self.path = self.game.map_grid.calculate_path(start, self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                    self.follow_path(path)
                 self.used_targets.append(self.target)
             else:
                 #ok, can't do ANYTHING
                 if self.target == None:
                     self.target = RandomTarget(self.game)
                     if not self.path or old_target != self.target:
-                        if not self.path:
-                            start = self.game.map_grid.screen_to_grid(self.rect.center)
-                        else:
-                            start = self.path[0]
-                        self.path = self.game.map_grid.calculate_path(start, self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                        self.path_to(self.target)
 
         if not self.path:
             if self.target:
-                start = self.game.map_grid.screen_to_grid(self.rect.center)
-                self.path = self.game.map_grid.calculate_path(start, self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                self.path_to(self.target)
 
         if self.target.was_killed:
             self.reset_target()
@@ -1140,13 +1126,11 @@ class Worker(Animation):
         if not self.rect.colliderect(self.target.rect):
             grid_pos = None
             if self.path:
-                x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                grid_pos = x+10, y+10
+                grid_pos = self.path.point()
                 if self.rect.centerx == grid_pos[0] and self.rect.centery == grid_pos[1]:
-                    self.path.pop(0)
+                    self.path.advance()
                     if self.path:
-                        x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                        grid_pos = x+10, y+10
+                        grid_pos = self.path.point()
                     else:
                         grid_pos = None
             if grid_pos:
@@ -1175,14 +1159,14 @@ class Worker(Animation):
                     self.reset_target()
                     self.animate("stand", 1, 1)
                     self.target = None
-                    self.path = None
+                    self.clear_path()
             elif isinstance(self.target, Scraps):
                 self.have_scraps = True
                 self.target.cooldown = True
                 self.reset_target()
                 self.target = self.game.hero
-                start = self.game.map_grid.screen_to_grid(self.rect.center)
-                self.path = self.game.map_grid.calculate_path(start, self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                self.clear_path()
+                self.path_to(self.target)
             elif isinstance(self.target, Hero):
                 if self.have_scraps:
                     self.game.scraps += self.scrap_load
@@ -1190,7 +1174,7 @@ class Worker(Animation):
                 self.game.update_money()
                 self.reset_target()
                 self.target = None
-                self.path = None
+                self.clear_path()
                 #do addition of scraps to inventory stuff here!!!
             elif isinstance(self.target, RandomTarget):
                 self.target = RandomTarget(self.game) #move again O.o
@@ -1202,6 +1186,30 @@ class Worker(Animation):
 
         Animation.kill(self)
 
+class StepCursor(object):
+    """Walks like a PathCursor but holds a single cell at a time - insects on the flow field
+       keep one and point it at each step as they get there, instead of a Path per step."""
+    def __init__(self):
+        self.target = None
+        self.target_point = None
+
+    def aim(self, cell, point):
+        self.target = cell
+        self.target_point = point
+        return self
+
+    def __nonzero__(self):
+        return self.target != None
+
+    def cell(self):
+        return self.target
+
+    def point(self):
+        return self.target_point
+
+    def advance(self):
+        self.target = None
+
 class Ant(Animation):
     def __init__(self, game, level=1):
         self.groups = game.main_group, game.insect_group
@@ -1242,9 +1250,33 @@ class Ant(Animation):
         self.netted_duration = 125 #this should probably be overwritten when netter?
         self.netted_count = 0
 
+        self.route = None #cursor along a bank route, while we are on one
+        self.route_version = None
+        self.step = StepCursor() #for flow field steps, off a route
+
     def reset_target(self):
         self.target = None
 
+    def follow_route(self, route):
+        """Walk a ready made route to the hero (from MapGrid.bank_route) instead of the flow field,
+           for as long as the grid stays the way it was when the route was found."""
+        self.route = route and route.walk()
+        self.route_version = self.game.map_grid.version
+
+    def next_step(self, pos):
+        """Return a cursor to the next cell toward our target, off our route or out of the shared flow field."""
+        if self.route:
+            if self.route_version == self.game.map_grid.version and self.route.cell() == pos:
+                self.route.advance()
+                if self.route:
+                    return self.route
+            self.route = None #off it, or it may not be there any more
+
+        step = self.game.map_grid.flow_step(pos, self.game.map_grid.screen_to_grid(self.target.rect.center))
+        if step:
+            return self.step.aim(step, self.game.map_grid.cell_center(step))
+        return None
+
     def hit(self, damage):
         Animation.hit(self, damage)
         if self.hp <= 0:
@@ -1279,14 +1311,8 @@ class Ant(Animation):
         else:
             self.attack_timer = 0
 
-        if self.path == None or not self.target:
+        if not self.target:
             self.target = self.game.hero
-            if not self.path:
-                start = self.game.map_grid.screen_to_grid(self.rect.center)
-            else:
-                start = self.path[0]
-            self.path = self.game.map_grid.calculate_path(start, self.game.map_grid.screen_to_grid(self.game.hero.rect.center))
-           
 
         if not self.rect.colliderect(self.target.rect):
             if self.netted:
@@ -1299,14 +1325,14 @@ class Ant(Animation):
                 self.stuck = False
                 return #assume this is set each frame by traps ;)
             grid_pos = None
+            if not self.path:
+                self.path = self.next_step(self.game.map_grid.screen_to_grid(self.rect.center))
             if self.path:
-                x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                grid_pos = x+10, y+10
+                grid_pos = self.path.point()
                 if self.rect.centerx == grid_pos[0] and self.rect.centery == grid_pos[1]:
-                    self.path.pop(0)
+                    self.path = self.next_step(self.path.cell())
                     if self.path:
-                        x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                        grid_pos = x+10, y+10
+                        grid_pos = self.path.point()
                     else:
                         grid_pos = None
             if grid_pos:
@@ -1421,7 +1447,11 @@ class Worm(Ant):
                 self.immune = False
 
 class Wasp(Ant):
+    """Flies straight over everything at the hero - it seeks a few noisy waypoints
+       on the way instead of asking the grid for a path."""
     diesound = 'die2.ogg'
+    flight_legs = 3 #waypoints on the way to the target, the last one is the target itself
+    flight_noise = 40 #pixels a waypoint may be knocked off the straight line, 0 flies dead straight
     def __init__(self, game, level=1):
         Ant.__init__(self, game, level)
         self.kill()
@@ -1447,6 +1477,48 @@ class Wasp(Ant):
 
         self.speed = 1
         self.flying = True
+        self.pos = self.rect.center #floats, the rect only holds whole pixels
+        self.waypoints = []
+
+    def plot_flight(self):
+        """Lay out waypoints from here to the target, each one knocked sideways a bit by
+           the grid's seeded stream so a swarm spreads out rather than flying in a line."""
+        rng = self.game.map_grid.rng
+        x, y = self.pos
+        tx, ty = self.target.rect.center
+        self.waypoints = []
+        for i in xrange(1, self.flight_legs):
+            f = i * 1.0 / self.flight_legs
+            jx = jy = 0
+            if self.flight_noise:
+                jx = rng.randint(-self.flight_noise, self.flight_noise)
+                jy = rng.randint(-self.flight_noise, self.flight_noise)
+            self.waypoints.append((x + (tx-x)*f + jx, y + (ty-y)*f + jy))
+
+    def seek(self):
+        """Take one pixel long step toward the next waypoint, or the target once they are used up."""
+        x, y = self.pos
+        if (int(round(x)), int(round(y))) != self.rect.center:
+            x, y = self.rect.center #something (a cage) moved us
+        while 1:
+            if self.waypoints:
+                gx, gy = self.waypoints[0]
+            else:
+                gx, gy = self.target.rect.center
+            dx = gx - x
+            dy = gy - y
+            dist = math.hypot(dx, dy)
+            if dist <= 1 and self.waypoints:
+                self.waypoints.pop(0)
+                continue
+            break
+        if dist > 1:
+            x += dx / dist
+            y += dy / dist
+        else:
+            x, y = gx, gy
+        self.pos = x, y
+        self.rect.center = int(round(x)), int(round(y))
 
     def update(self):
 
@@ -1469,14 +1541,9 @@ class Wasp(Ant):
         else:
             self.attack_timer = 0
 
-        if self.path == None or not self.target:
+        if not self.target:
             self.target = self.game.hero
-            if not self.path:
-                start = self.game.map_grid.screen_to_grid(self.rect.center)
-            else:
-                start = self.path[0]
-            self.path = self.game.map_grid.calculate_path(start, self.game.map_grid.screen_to_grid(self.game.hero.rect.center))
-           
+            self.plot_flight()
 
         if not self.rect.colliderect(self.target.rect):
             if self.netted:
@@ -1488,32 +1555,12 @@ class Wasp(Ant):
             if self.stuck:
                 self.stuck = False
                 return #assume this is set each frame by traps ;)
-            grid_pos = None
-            if self.path:
-                x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                grid_pos = x+10, y+10
-                if self.rect.centerx == grid_pos[0] and self.rect.centery == grid_pos[1]:
-                    self.path.pop(0)
-                    if self.path:
-                        x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                        grid_pos = x+10, y+10
-                    else:
-                        grid_pos = None
-            if grid_pos:
-                self.move_timer += 1
-                if self.move_timer >= self.speed:
-                    self.animate("walk", int(self.ani_speed/self.speed), 1)
-                    self.angle = 0
-                    self.move_timer = 0
-                    if grid_pos[0] < self.rect.centerx:
-                        self.rect.move_ip(-1, 0)
-                    elif grid_pos[0] > self.rect.centerx:
-                        self.rect.move_ip(1, 0)
-
-                    if grid_pos[1] < self.rect.centery:
-                        self.rect.move_ip(0, -1)
-                    elif grid_pos[1] > self.rect.centery:
-                        self.rect.move_ip(0, 1)
+            self.move_timer += 1
+            if self.move_timer >= self.speed:
+                self.animate("walk", int(self.ani_speed/self.speed), 1)
+                self.angle = 0
+                self.move_timer = 0
+                self.seek()
         else:
             self.target.hit(1)
             self.kill()
@@ -1682,10 +1729,8 @@ class SpikeTrap(GameObject):
         self.image = data.image("data/spikes.png")
 
         self.rect = self.image.get_rect()
-        x, y = pos
-        x += 10
-        y += 20 #so we can put it at center...
-        self.rect.midbottom = x, y
+        self.cell = self.game.map_grid.screen_to_grid(pos)
+        self.rect.midbottom = self.game.map_grid.cell_midbottom(self.cell) #so we can put it at center...
 
         self.game.money -= self.money_cost
         self.game.scraps -= self.scrap_cost
@@ -1697,7 +1742,7 @@ class SpikeTrap(GameObject):
         self.max_times = int(self.base_usage_count)
 
         #set blocking!
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(pos), 1)
+        self.game.map_grid.set(self.cell, 1)
 
         self.attack_timer = 0
         self.damage = int(self.base_damage)
@@ -1712,7 +1757,7 @@ class SpikeTrap(GameObject):
     def kill(self):
         GameObject.kill(self)
         self.game.audio.sounds[self.diesound].play()
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(self.rect.topleft), 0)
+        self.game.map_grid.set(self.cell, 0)
 
     def update(self):
         for i in self.game.insect_group.objects:
@@ -1743,10 +1788,8 @@ class CageTrap(GameObject):
         self.image = data.image("data/cage.png")
 
         self.rect = self.image.get_rect()
-        x, y = pos
-        x += 10
-        y += 20 #so we can put it at center...
-        self.rect.midbottom = x, y
+        self.cell = self.game.map_grid.screen_to_grid(pos)
+        self.rect.midbottom = self.game.map_grid.cell_midbottom(self.cell) #so we can put it at center...
 
         self.game.money -= self.money_cost
         self.game.scraps -= self.scrap_cost
@@ -1760,7 +1803,7 @@ class CageTrap(GameObject):
         self.max_times = int(self.base_usage_count)
 
         #set blocking!
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(pos), 1)
+        self.game.map_grid.set(self.cell, 1)
 
         for i in xrange(self.game.hero.trap_level-1):
             self.upgrade_level()
@@ -1772,7 +1815,7 @@ class CageTrap(GameObject):
     def kill(self):
         GameObject.kill(self)
         self.game.audio.sounds[self.diesound].play()
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(self.rect.topleft), 0)
+        self.game.map_grid.set(self.cell, 0)
 
     def update(self):
         for i in self.game.insect_group.objects:
@@ -1802,10 +1845,8 @@ class BombTrap(GameObject):
         self.image = data.image("data/bomb.png")
 
         self.rect = self.image.get_rect()
-        x, y = pos
-        x += 10
-        y += 20 #so we can put it at center...
-        self.rect.midbottom = x, y
+        self.cell = self.game.map_grid.screen_to_grid(pos)
+        self.rect.midbottom = self.game.map_grid.cell_midbottom(self.cell) #so we can put it at center...
 
         self.game.money -= self.money_cost
         self.game.scraps -= self.scrap_cost
@@ -1819,7 +1860,7 @@ class BombTrap(GameObject):
         self.max_times = int(self.base_usage_count)
 
         #set blocking!
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(pos), 1)
+        self.game.map_grid.set(self.cell, 1)
 
         for i in xrange(self.game.hero.trap_level-1):
             self.upgrade_level()
@@ -1831,7 +1872,7 @@ class BombTrap(GameObject):
     def kill(self):
         GameObject.kill(self)
         self.game.audio.sounds[self.diesound].play()
-        self.game.map_grid.set(self.game.map_grid.screen_to_grid(self.rect.topleft), 0)
+        self.game.map_grid.set(self.cell, 0)
 
     def update(self):
         targets = []
@@ -1896,6 +1937,7 @@ class BattleBot(Worker):
             self.upgrade_level()
 
         self.path = None
+        self.path_request = None
 
         self.count = 0
 
@@ -1906,6 +1948,8 @@ class BattleBot(Worker):
         self.level += 1
 
     def update(self):
+        self.check_path_request()
+
         #Battling first, because we gotta stop movement for that!
         do_hit = []
 
@@ -1931,8 +1975,7 @@ class BattleBot(Worker):
         if not self.target:
             self.target = self.game.hive
 
-            self.path = self.game.map_grid.calculate_path(self.game.map_grid.screen_to_grid(self.rect.center),
-                                self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+            self.path_to(self.target)
 
         old_target = self.target
         diso = None
@@ -1949,47 +1992,34 @@ class BattleBot(Worker):
         if diso:
             if not (diso[0] == old_target and self.path):
                 self.target = diso[0]
-                if not self.path:
-                    start = self.game.map_grid.screen_to_grid(self.rect.center)
-                else:
-                    start = self.path[0]
-                self.path = self.game.map_grid.calculate_path(start,
-                                self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                self.path_to(self.target)
                 self.count = 0
             else:
                 self.count += 1
                 if self.count >= 80:
-                    if not self.path:
-                        start = self.game.map_grid.screen_to_grid(self.rect.center)
-                    else:
-                        start = self.path[0]
-                    self.path = self.game.map_grid.calculate_path(start,
-                                    self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                    self.path_to(self.target)
                     self.count = 0
         else:
             if not self.target == self.game.hive:
                 self.target = self.game.hive
 
-                self.path = self.game.map_grid.calculate_path(self.game.map_grid.screen_to_grid(self.rect.center),
-                                    self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                self.path_to(self.target)
 
         #later!
         if self.target.was_killed:
             self.reset_target()
-            self.path = None
+            self.clear_path()
             self.animate("stand", 1, 1)
             return
 
         if not self.rect.inflate(3,3).colliderect(self.target.rect):
             grid_pos = None
             if self.path:
-                x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                grid_pos = x+10, y+10
+                grid_pos = self.path.point()
                 if self.rect.centerx == grid_pos[0] and self.rect.centery == grid_pos[1]:
-                    self.path.pop(0)
+                    self.path.advance()
                     if self.path:
-                        x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                        grid_pos = x+10, y+10
+                        grid_pos = self.path.point()
                     else:
                         grid_pos = None
             if grid_pos:
@@ -2128,6 +2158,8 @@ class GuardBot(BattleBot):
         self.level += 1
 
     def update(self):
+        self.check_path_request()
+
         #Battling first, because we gotta stop movement for that!
         do_hit = []
 
@@ -2173,40 +2205,28 @@ class GuardBot(BattleBot):
         if diso:
             if (not diso[0] == old_target) or (not self.path):
                 self.target = diso[0]
-                if not self.path:
-                    start = self.game.map_grid.screen_to_grid(self.rect.center)
-                else:
-                    start = self.path[0]
-                self.path = self.game.map_grid.calculate_path(start,
-                                self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                self.path_to(self.target)
         else:
             #what?!?! this really shouldn't happen...
             if (not self.target == self.game.hive) or (not self.path):
                 self.target = self.game.hive
-                if not self.path:
-                    start = self.game.map_grid.screen_to_grid(self.rect.center)
-                else:
-                    start = self.path[0]
-                self.path = self.game.map_grid.calculate_path(start,
-                                self.game.map_grid.screen_to_grid(self.target.rect.center), False, False)
+                self.path_to(self.target)
 
         #later!
         if self.target.was_killed:
             self.reset_target()
-            self.path = None
+            self.clear_path()
             self.animate("stand", 1, 1)
             return
 
         if not self.rect.inflate(3,3).colliderect(self.target.rect):
             grid_pos = None
             if self.path:
-                x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                grid_pos = x+10, y+10
+                grid_pos = self.path.point()
                 if self.rect.centerx == grid_pos[0] and self.rect.centery == grid_pos[1]:
-                    self.path.pop(0)
+                    self.path.advance()
                     if self.path:
-                        x, y = self.game.map_grid.grid_to_screen(self.path[0])
-                        grid_pos = x+10, y+10
+                        grid_pos = self.path.point()
                     else:
                         grid_pos = None
             if grid_pos:
@@ -2301,7 +2321,7 @@ class SprayCanSpecial(GameObject):
 
         self.image = data.image("data/spray_can.png")
         self.rect = self.image.get_rect()
-        self.rect.topright = (800,0)
+        self.rect.topright = (game.map_grid.pixel_size[0],0)
 
         self.spray_count = 5
 
@@ -2314,7 +2334,7 @@ class SprayCanSpecial(GameObject):
             self.spray_count = 0
 
         self.rect.move_ip(0,4)
-        if self.rect.top > 500:
+        if self.rect.top > self.game.map_grid.pixel_size[1]:
             self.kill()
 
 
@@ -2337,9 +2357,10 @@ class BroomSpecial(GameObject):
 
         r = pygame.Rect(0,0,self.rect.width, self.rect.width)
         r.midbottom = self.rect.midbottom
-        if r.centery >= 475 or r.centerx <= 25:
+        width, height = self.game.map_grid.pixel_size
+        if r.centery >= height-25 or r.centerx <= 25:
             self.d = (10,-20)
-        elif r.centerx >= 775 or r.centery <= 25:
+        elif r.centerx >= width-25 or r.centery <= 25:
             self.d = (-10,20)
             self.rect.move_ip(-45,0)
 
@@ -2367,7 +2388,7 @@ class MowerSpecial(GameObject):
 
         self.image = pygame.transform.rotate(data.image("data/mower.png"), 90)
         self.rect = self.image.get_rect()
-        self.rect.topright = 800,0
+        self.rect.topright = game.map_grid.pixel_size[0],0
 
         self.d = -1
 
@@ -2382,7 +2403,7 @@ class MowerSpecial(GameObject):
             self.d = 1
             self.rect.move_ip(0, 100)
             self.image = pygame.transform.flip(self.image, 1, 0)
-        elif self.rect.left > 800 and self.d == 1:
+        elif self.rect.left > self.game.map_grid.pixel_size[0] and self.d == 1:
             self.d = -1
             self.rect.move_ip(0, 100)
             self.image = pygame.transform.flip(self.image, 1, 0)
@@ -2407,5 +2428,5 @@ class MowerSpecial(GameObject):
                 self.game.hive.hit(random.randint(4,8))
                 self.hit_hive = True
 
-        if self.rect.centery > 500:
+        if self.rect.centery > self.game.map_grid.pixel_size[1]:
             self.kill()
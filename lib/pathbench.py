@@ -0,0 +1,363 @@
+"""Headless pathfinding benchmark.
+
+Run it from the game directory with:
+    python lib/pathbench.py
+
+It builds a handful of seeded lawns straight onto a MapGrid (no display is
+needed) and runs the same searches the game does, reporting how many nodes
+each search expanded, how long the paths were and how long it all took.
+
+The generated mixes at the end lay their lawns out with make_random's own
+layout and go through calculate_path like the game, so they also report
+what the searches need in memory: the biggest open list any of them had,
+and how many paths (and waypoints in them) the cache is holding after."""
+
+import sys, time, random
+
+import map_grid
+
+SEEDS = (1, 2, 3, 4, 5)
+QUERIES = 40
+LARGE_SIZE = (200, 125) #25 times the area of the normal lawn
+LARGE_QUERIES = 4
+FINE_CELL_SIZE = 10 #the normal lawn cut into four times as many cells
+SOLVER_PROCESSES = 2
+GENERATED_QUERIES = 100
+
+def make_grid(seed, size=None, boulders=60, towers=10, cell_size=map_grid.CELL_SIZE):
+    """Scatter boulders and towers over an empty MapGrid, scaled up with its area."""
+    rng = random.Random(seed)
+    grid = map_grid.MapGrid(None, size, seed, cell_size)
+    numcols, numrows = grid.size
+    scale = numcols * numrows / 1000.0
+    boulders = int(boulders * scale)
+    towers = int(towers * scale)
+
+    for code, count in ((2, boulders), (3, towers)):
+        placed = 0
+        while placed < count:
+            pos = (rng.randrange(numcols), rng.randrange(numrows))
+            if grid.empty_around(pos):
+                grid.set(pos, code)
+                placed += 1
+    return grid
+
+def make_lawn(seed, towers=10):
+    """Lay a lawn out the way a new game does, returning (grid, scrap cells) - then put
+       some towers down, so the insects have something to keep away from."""
+    rng = random.Random(seed)
+    grid = map_grid.MapGrid(None, seed=seed)
+    boulders, scraps = grid.random_layout(rng.randint(40, 60), 10, rng)
+
+    numcols, numrows = grid.size
+    for i in xrange(towers*50):
+        if not towers:
+            break
+        pos = (rng.randrange(numcols), rng.randrange(numrows))
+        if grid.empty_around(pos):
+            grid.set(pos, 3)
+            towers -= 1
+    return grid, scraps
+
+def wall_in(grid, goal):
+    for dx, dy in map_grid.RING:
+        grid.set((goal[0]+dx, goal[1]+dy), 2)
+
+def fixed_path(grid, start, end, avoid_towers):
+    """One way a* with the costs bidirectional_path uses - every step 1, NEAR_AVOID_COST
+       more next to anything with avoid_towers, and no random edge costs - so the two can
+       be set against each other on the same problem. Same arena, same open list."""
+    numcols, numrows = grid.size
+    arena = grid.arena
+    arena.reset()
+    startindex = start[1]*numcols + start[0]
+    endindex = end[1]*numcols + end[0]
+    arena.stamp[startindex] = arena.generation
+    arena.inlist[startindex] = map_grid.INOPENLIST
+    arena.movecost[startindex] = 0
+    arena.parent[startindex] = -1
+    arena.openlist.push(startindex, 0)
+    grid.last_expanded = 0
+    while len(arena.openlist):
+        cost, index = arena.openlist.pop()
+        grid.last_expanded += 1
+        if index == endindex:
+            path = []
+            while index != -1:
+                path.append((index%numcols, index/numcols))
+                index = arena.parent[index]
+            path.reverse()
+            return path
+        arena.inlist[index] = map_grid.INCLOSEDLIST
+        x = index % numcols
+        y = index / numcols
+        for newx, newy in ((x, y-1), (x-1, y), (x+1, y), (x, y+1)):
+            if newx < 0 or newx >= numcols or newy < 0 or newy >= numrows:
+                continue
+            newindex = newy*numcols + newx
+            if grid.grid[newindex] >= 2 and newindex != endindex:
+                continue
+            movecost = arena.movecost[index] + 1
+            if avoid_towers and grid.near[newindex]:
+                movecost += map_grid.NEAR_AVOID_COST
+            newcost = movecost + abs(end[0]-newx) + abs(end[1]-newy)
+            if arena.stamp[newindex] != arena.generation:
+                arena.stamp[newindex] = arena.generation
+                arena.inlist[newindex] = map_grid.INOPENLIST
+                arena.openlist.push(newindex, newcost)
+            elif arena.inlist[newindex] == map_grid.INOPENLIST and movecost < arena.movecost[newindex]:
+                arena.openlist.decrease(newindex, newcost)
+            else:
+                continue
+            arena.movecost[newindex] = movecost
+            arena.parent[newindex] = index
+    return False
+
+def open_cells(grid):
+    numcols, numrows = grid.size
+    cells = []
+    for y in xrange(numrows):
+        for x in xrange(numcols):
+            if grid.is_open((x, y)):
+                cells.append((x, y))
+    return cells
+
+def run_mix(name, grids, make_query, avoid_towers, very_random, hierarchical=False, queries=QUERIES,
+            jump_points=True, bidirectional=False, fixed=False):
+    searches = expanded = length = failed = 0
+    build = ""
+    if hierarchical:
+        #the cluster graph is built once per map and then reused, time that on its own
+        t = time.time()
+        for seed, grid in grids:
+            grid.cluster_graph(avoid_towers).refresh()
+        build = "  (graph build: %.1f ms/map)" % ((time.time() - t)*1000.0/len(grids))
+
+    t = time.time()
+    for seed, grid in grids:
+        rng = random.Random(seed)
+        cells = open_cells(grid)
+        for i in xrange(queries):
+            start, end = make_query(grid, cells, rng)
+            if hierarchical:
+                path = grid.hierarchical_path(start, end, avoid_towers)
+            elif bidirectional:
+                path = grid.bidirectional_path(start, end, avoid_towers)
+            elif fixed:
+                path = fixed_path(grid, start, end, avoid_towers)
+            else:
+                path = grid.search_path(start, end, avoid_towers, very_random, jump_points)
+            searches += 1
+            expanded += grid.last_expanded
+            if path:
+                length += len(path)
+            else:
+                failed += 1
+    t = time.time() - t
+
+    found = searches - failed
+    print "%-12s searches: %4d  expanded/search: %7.1f  path length: %5.1f  failed: %3d  ms/search: %6.3f%s" % (
+        name, searches, expanded*1.0/searches, length*1.0/(found or 1), failed, t*1000.0/searches, build)
+
+def run_queued(name, make_query, avoid_towers, very_random, processes=0, queries=QUERIES):
+    """Queue a frame's worth of searches per map and drain them with update_requests,
+       timing how long the game loop itself spends in there against the wall clock."""
+    if processes:
+        map_grid.start_solver_pool(processes)
+    searches = failed = frames = saved = 0
+    busy = 0.0
+    t = time.time()
+    for seed in SEEDS:
+        grid = make_grid(seed)
+        rng = random.Random(seed)
+        cells = open_cells(grid)
+        requests = []
+        for i in xrange(queries):
+            start, end = make_query(grid, cells, rng)
+            requests.append(grid.request_path(start, end, avoid_towers, very_random))
+        while grid.requests or grid.solver_batches:
+            frame = time.time()
+            grid.next_frame()
+            grid.update_requests()
+            busy += time.time() - frame
+            frames += 1
+            if processes:
+                time.sleep(0.001) #the rest of the frame, while the solvers get on with it
+        searches += len(requests)
+        failed += len([i for i in requests if not i.path])
+        saved += grid.searches_saved
+    t = time.time() - t
+    map_grid.stop_solver_pool()
+
+    print "%-12s searches: %4d  frames: %5d  failed: %3d  saved: %3d  game loop ms: %7.1f  wall ms: %7.1f" % (
+        name, searches, frames, failed, saved, busy*1000.0, t*1000.0)
+
+def run_walled(name, grids, rejected, queries=QUERIES):
+    """Searches for a goal that has been walled in, which a* only gives up on after
+       exploring everything it can reach - unless the region labels turn it down first."""
+    searches = expanded = 0
+    t = time.time()
+    for seed, grid in grids:
+        rng = random.Random(seed)
+        goal = (grid.size[0]/2, grid.size[1]/2)
+        wall_in(grid, goal)
+        cells = open_cells(grid)
+        for i in xrange(queries):
+            start = rng.choice(cells)
+            grid.last_expanded = 0
+            if rejected:
+                path = grid.calculate_path(start, goal)
+            else:
+                path = grid.search_path(start, goal)
+            searches += 1
+            expanded += grid.last_expanded
+    t = time.time() - t
+
+    print "%-12s searches: %4d  expanded/search: %7.1f  ms/search: %6.3f" % (
+        name, searches, expanded*1.0/searches, t*1000.0/searches)
+
+def run_blocked(name, grids, queries=QUERIES):
+    """Goals blocked off on every side but one, where the open side is over a cluster border,
+       through the cluster graph and through fixed_path. Both should find the same trips,
+       so "wrong" ought to be 0."""
+    searches = wrong = 0
+    for seed, grid in grids:
+        rng = random.Random(seed)
+        numcols, numrows = grid.size
+        goals = []
+        while len(goals) < 4:
+            x = rng.randrange(1, numcols/map_grid.CLUSTER_SIZE) * map_grid.CLUSTER_SIZE - rng.randrange(2)
+            y = rng.randrange(1, numrows-1)
+            inside = x % map_grid.CLUSTER_SIZE and -1 or 1 #the other way is over the border
+            for cell in ((x, y), (x+inside, y), (x, y-1), (x, y+1)):
+                grid.set(cell, 2)
+            grid.set((x-inside, y), 0)
+            goals.append((x, y))
+        grid.cluster_graph(True).refresh()
+        cells = open_cells(grid)
+        for i in xrange(queries):
+            start, goal = rng.choice(cells), rng.choice(goals)
+            searches += 1
+            if bool(grid.hierarchical_path(start, goal)) != bool(fixed_path(grid, start, goal, True)):
+                wrong += 1
+
+    print "%-12s searches: %4d  wrong: %3d" % (name, searches, wrong)
+
+def run_generated(name, lawns, make_query, avoid_towers, very_random, queries=GENERATED_QUERIES):
+    """Put queries through calculate_path on generated lawns, cache and all, the way the game does."""
+    searches = expanded = length = failed = open_peak = cached = waypoints = 0
+
+    t = time.time()
+    for seed, grid, scraps in lawns:
+        rng = random.Random(seed)
+        cells = open_cells(grid)
+        for i in xrange(queries):
+            start, end = make_query(grid, cells, scraps, rng)
+            grid.next_frame() #a frame per query, or they would all share the first one's path
+            grid.last_expanded = grid.last_open_peak = 0 #a cache hit expands nothing
+            path = grid.calculate_path(start, end, avoid_towers, very_random)
+            searches += 1
+            expanded += grid.last_expanded
+            open_peak = max(open_peak, grid.last_open_peak)
+            if path:
+                length += len(path)
+            else:
+                failed += 1
+    t = time.time() - t
+
+    for seed, grid, scraps in lawns:
+        for tick, path in grid.path_cache.values():
+            cached += 1
+            if path:
+                waypoints += len(path.waypoints)
+
+    found = searches - failed
+    print "%-12s searches: %4d  expanded/search: %7.1f  path length: %5.1f  failed: %3d  ms/search: %6.3f" % (
+        name, searches, expanded*1.0/searches, length*1.0/(found or 1), failed, t*1000.0/searches),
+    print " open peak: %5d  cached/lawn: %5.1f paths %6.1f waypoints" % (
+        open_peak, cached*1.0/len(lawns), waypoints*1.0/len(lawns))
+
+def hive_to_hero(grid, cells, rng):
+    return (5, 5), (grid.size[0]-4, grid.size[1]-4)
+
+def hero_to_hive(grid, cells, rng):
+    return (grid.size[0]-4, grid.size[1]-4), (5, 5)
+
+def hero_to_open(grid, cells, rng):
+    return (grid.size[0]-4, grid.size[1]-4), rng.choice(cells)
+
+def open_to_open(grid, cells, rng):
+    return rng.choice(cells), rng.choice(cells)
+
+def hero_to_scraps(grid, cells, scraps, rng):
+    return (grid.size[0]-4, grid.size[1]-4), rng.choice(scraps)
+
+def generated_hive_to_hero(grid, cells, scraps, rng):
+    return hive_to_hero(grid, cells, rng)
+
+def open_to_walled(grid, cells, scraps, rng):
+    goal = (grid.size[0]/2, grid.size[1]/2)
+    start = goal
+    while start == goal: #the goal itself may be open, inside its wall
+        start = rng.choice(cells)
+    return start, goal
+
+def main():
+    grids = [(seed, make_grid(seed)) for seed in SEEDS]
+    run_mix("insects", grids, hive_to_hero, True, True)
+    run_mix("workers", grids, hero_to_open, False, False)
+    run_mix("wanderers", grids, open_to_open, False, False)
+
+    #uniform cost searches go through jump point search, see how plain a* does on them
+    run_mix("workers a*", grids, hero_to_open, False, False, jump_points=False)
+    open_grids = [(seed, make_grid(seed, boulders=10, towers=0)) for seed in SEEDS]
+    run_mix("open a*", open_grids, open_to_open, False, False, jump_points=False)
+    run_mix("open jps", open_grids, open_to_open, False, False)
+
+    #long hive to hero trips on a much bigger lawn, plain a* against the cluster graph
+    grids = [(seed, make_grid(seed, LARGE_SIZE)) for seed in SEEDS[:3]]
+    run_mix("large a*", grids, hive_to_hero, True, True, queries=LARGE_QUERIES)
+    run_mix("large hpa*", grids, hive_to_hero, True, True, True, LARGE_QUERIES)
+    #bidirectional search has no random edge costs, so it goes up against a* without them
+    run_mix("large fixed", grids, hive_to_hero, True, True, queries=LARGE_QUERIES, fixed=True)
+    run_mix("large bidir", grids, hive_to_hero, True, True, queries=LARGE_QUERIES, bidirectional=True)
+
+    #the same lawn on a finer grid
+    grids = [(seed, make_grid(seed, cell_size=FINE_CELL_SIZE)) for seed in SEEDS[:3]]
+    run_mix("fine insects", grids, hive_to_hero, True, True, queries=LARGE_QUERIES)
+    run_mix("fine workers", grids, hero_to_open, False, False, queries=LARGE_QUERIES)
+
+    #bots crossing the whole map from the hero to the hive, one way and from both ends
+    grids = [(seed, make_grid(seed)) for seed in SEEDS]
+    run_mix("bots a*", grids, hero_to_hive, False, False, jump_points=False)
+    run_mix("bots fixed", grids, hero_to_hive, False, False, fixed=True)
+    run_mix("bots bidir", grids, hero_to_hive, False, False, bidirectional=True)
+    run_mix("bots jps", grids, hero_to_hive, False, False)
+    run_mix("insect fixed", grids, hive_to_hero, True, True, fixed=True)
+    run_mix("insect bidir", grids, hive_to_hero, True, True, bidirectional=True)
+
+    #goals nobody can get to
+    grids = [(seed, make_grid(seed)) for seed in SEEDS]
+    run_walled("walled a*", grids, False)
+    run_walled("walled", grids, True)
+
+    #blocked goals only reached from the next cluster over, like scraps by a cluster border
+    grids = [(seed, make_grid(seed)) for seed in SEEDS]
+    run_blocked("blocked hpa*", grids)
+
+    #the request queue sliced up in the game loop, then handed to solver processes
+    run_queued("queued", hero_to_open, False, False)
+    run_queued("queued pool", hero_to_open, False, False, SOLVER_PROCESSES)
+    run_queued("queued group", hive_to_hero, True, True) #a wave all asking for the same trip at once
+
+    #lawns laid out like a real game: insects heading for the hero round the towers,
+    #workers fetching scraps and somebody trying to get somewhere walled off
+    lawns = [(seed,) + make_lawn(seed) for seed in SEEDS]
+    run_generated("gen insects", lawns, generated_hive_to_hero, True, True)
+    run_generated("gen scraps", lawns, hero_to_scraps, False, False)
+    for seed, grid, scraps in lawns:
+        wall_in(grid, (grid.size[0]/2, grid.size[1]/2))
+    run_generated("gen walled", lawns, open_to_walled, True, True)
+
+if __name__ == "__main__":
+    main()
@@ -95,6 +95,8 @@ class Menu(GameState):
         self.app.render()
         pygame.display.flip()
 
+        map_grid.top_up_layouts() #get the next few lawns ready while nobody is playing
+
 class StoryScreen(GameState):
     def __init__(self, parent):
         GameState.__init__(self, parent)
@@ -483,7 +485,7 @@ class YouLostMenu(GameState):
         pygame.display.flip()
 
 class Game(GameState):
-    def __init__(self, parent, mode="easy"):
+    def __init__(self, parent, mode="easy", size=None, cell_size=map_grid.CELL_SIZE):
         GameState.__init__(self, parent)
 
         self.screen = self.get_root().screen
@@ -538,20 +540,22 @@ class Game(GameState):
 
         self.kills = 0
 
+        layout = map_grid.take_layout(size, cell_size)
+        self.map_grid = map_grid.MapGrid(self, layout.size, layout.seed, layout.cell_size)
+        self.ui_top = self.map_grid.pixel_size[1] #the ui bar goes right under the lawn
+
         self.font = data.font("data/font.ttf", 24)
 
         self.money_ui = self.font.render("money: %s"%self.money, 1, (255,255,255))
-        self.money_ui_pos = (0, 530)
+        self.money_ui_pos = (0, self.ui_top+30)
         self.scraps_ui = self.font.render("scraps: %s"%self.scraps, 1, (255,255,255))
-        self.scraps_ui_pos = (0, 550)
+        self.scraps_ui_pos = (0, self.ui_top+50)
         self.kills_ui = self.font.render("kills: %s"%self.kills, 1, (255,255,255))
-        self.kills_ui_pos = (0, 570)
-
-        self.map_grid = map_grid.MapGrid(self)
+        self.kills_ui_pos = (0, self.ui_top+70)
 
         self.hero = objects.Hero(self)
 
-        self.map_grid.make_random(random.randint(40, 60), scraps)
+        self.map_grid.use_layout(layout, scraps)
 
         self.build_active = None
         self.building = None
@@ -562,13 +566,13 @@ class Game(GameState):
 
         #UI here, so it has access to all the data above!
         self.app = ui.App(self.screen)
-        ui.Button(self.app, "Quit Game", pos=(0,500), callback=self.goback,
+        ui.Button(self.app, "Quit Game", pos=(0,self.ui_top), callback=self.goback,
                   status_message="Quit game...?")
 
         #Make build objects gui
         #TODO: implement multiple kinds of warriors/traps!!!
 
-        l = ui.Label(self.app, "Basic", pos=(180, 500))
+        l = ui.Label(self.app, "Basic", pos=(180, self.ui_top))
         ui.LinesGroup(self.app, l)
         b = ui.Button(self.app, image=objects.TowerBase.ui_icon, pos=l.rect.inflate(0,2).bottomleft,
                   callback=self.build_tower,
@@ -591,7 +595,7 @@ class Game(GameState):
                       anchor="topleft")
         self.build_worker_button = b
 
-        l = ui.Label(self.app, "Warriors ", pos=(250, 500))
+        l = ui.Label(self.app, "Warriors ", pos=(250, self.ui_top))
         ui.LinesGroup(self.app, l)
         b = ui.Button(self.app, image=objects.BattleBot.ui_icon, pos=l.rect.inflate(0,2).bottomleft,
                   callback=self.build_warrior,
@@ -630,7 +634,7 @@ class Game(GameState):
         self.build_guard_button = b
         
 
-        l = ui.Label(self.app, " Traps ", pos=(370, 500))
+        l = ui.Label(self.app, " Traps ", pos=(370, self.ui_top))
         ui.LinesGroup(self.app, l)
         b = ui.Button(self.app, image=objects.SpikeTrap.ui_icon, pos=l.rect.inflate(0,2).bottomleft,
                   callback=self.build_spike_trap,
@@ -667,7 +671,7 @@ class Game(GameState):
 
 
         #Ooh, techs, gotta love them!
-        l = ui.Label(self.app, "  Techs   ", pos=(470, 500))
+        l = ui.Label(self.app, "  Techs   ", pos=(470, self.ui_top))
         ui.LinesGroup(self.app, l)
         i = pygame.Surface((30,30)).convert_alpha()
         i.fill((0,0,0,0))
@@ -699,7 +703,7 @@ class Game(GameState):
                                                                                    self.hero.tech_trap_upgrade_cost),
                       anchor="topleft")
 
-        l = ui.Label(self.app, "Specials    ", pos=(610, 500))
+        l = ui.Label(self.app, "Specials    ", pos=(610, self.ui_top))
         ui.LinesGroup(self.app, l)
         i = pygame.transform.scale(data.image("data/spray_can.png"), (35, 60))
         self.special_spray = ui.Button(self.app, image=i, pos=l.rect.inflate(0,2).bottomleft,
@@ -852,14 +856,18 @@ class Game(GameState):
             self.build_active = True
             self.building = objects.TowerBase
 
-            bo = pygame.Surface((800,500)).convert_alpha()
+            bo = pygame.Surface(self.map_grid.pixel_size).convert_alpha()
             bo.fill((0,0,0,0))
+            cs = self.map_grid.cell_size
+            width, height = self.map_grid.pixel_size
+            enemy = (self.map_grid.enemy_area+1) * cs #the +1 is the ring empty_around keeps clear
+            hero = (self.map_grid.hero_area+1) * cs
             for x in xrange(self.map_grid.size[0]):
                 for y in xrange(self.map_grid.size[1]):
                     if not self.map_grid.empty_around((x, y)):
-                        pygame.draw.rect(bo, (200,0,0,125), (self.map_grid.grid_to_screen((x, y)), (20,20)))
-            pygame.draw.rect(bo, (200,0,0,125), ((0,0), (11*20,11*20)))
-            pygame.draw.rect(bo, (200,0,0,125), ((800-9*20,500-9*20), (9*20,9*20)))
+                        pygame.draw.rect(bo, (200,0,0,125), (self.map_grid.grid_to_screen((x, y)), (cs,cs)))
+            pygame.draw.rect(bo, (200,0,0,125), ((0,0), (enemy,enemy)))
+            pygame.draw.rect(bo, (200,0,0,125), ((width-hero,height-hero), (hero,hero)))
 
             self.build_overlay = bo
 
@@ -882,14 +890,18 @@ class Game(GameState):
             self.building = objects.SpikeTrap
             self.build_active = True
 
-            bo = pygame.Surface((800,500)).convert_alpha()
+            bo = pygame.Surface(self.map_grid.pixel_size).convert_alpha()
             bo.fill((0,0,0,0))
+            cs = self.map_grid.cell_size
+            width, height = self.map_grid.pixel_size
+            enemy = (self.map_grid.enemy_area+1) * cs #the +1 is the ring empty_around keeps clear
+            hero = (self.map_grid.hero_area+1) * cs
             for x in xrange(self.map_grid.size[0]):
                 for y in xrange(self.map_grid.size[1]):
                     if not self.map_grid.is_open((x, y)):
-                        pygame.draw.rect(bo, (200,0,0,125), (self.map_grid.grid_to_screen((x, y)), (20,20)))
-            pygame.draw.rect(bo, (200,0,0,125), ((0,0), (11*20,11*20)))
-            pygame.draw.rect(bo, (200,0,0,125), ((800-9*20,500-9*20), (9*20,9*20)))
+                        pygame.draw.rect(bo, (200,0,0,125), (self.map_grid.grid_to_screen((x, y)), (cs,cs)))
+            pygame.draw.rect(bo, (200,0,0,125), ((0,0), (enemy,enemy)))
+            pygame.draw.rect(bo, (200,0,0,125), ((width-hero,height-hero), (hero,hero)))
 
             self.build_overlay = bo
 
@@ -898,14 +910,18 @@ class Game(GameState):
             self.building = objects.CageTrap
             self.build_active = True
 
-            bo = pygame.Surface((800,500)).convert_alpha()
+            bo = pygame.Surface(self.map_grid.pixel_size).convert_alpha()
             bo.fill((0,0,0,0))
+            cs = self.map_grid.cell_size
+            width, height = self.map_grid.pixel_size
+            enemy = (self.map_grid.enemy_area+1) * cs #the +1 is the ring empty_around keeps clear
+            hero = (self.map_grid.hero_area+1) * cs
             for x in xrange(self.map_grid.size[0]):
                 for y in xrange(self.map_grid.size[1]):
                     if not self.map_grid.is_open((x, y)):
-                        pygame.draw.rect(bo, (200,0,0,125), (self.map_grid.grid_to_screen((x, y)), (20,20)))
-            pygame.draw.rect(bo, (200,0,0,125), ((0,0), (11*20,11*20)))
-            pygame.draw.rect(bo, (200,0,0,125), ((800-9*20,500-9*20), (9*20,9*20)))
+                        pygame.draw.rect(bo, (200,0,0,125), (self.map_grid.grid_to_screen((x, y)), (cs,cs)))
+            pygame.draw.rect(bo, (200,0,0,125), ((0,0), (enemy,enemy)))
+            pygame.draw.rect(bo, (200,0,0,125), ((width-hero,height-hero), (hero,hero)))
 
             self.build_overlay = bo
 
@@ -914,14 +930,18 @@ class Game(GameState):
             self.building = objects.BombTrap
             self.build_active = True
 
-            bo = pygame.Surface((800,500)).convert_alpha()
+            bo = pygame.Surface(self.map_grid.pixel_size).convert_alpha()
             bo.fill((0,0,0,0))
+            cs = self.map_grid.cell_size
+            width, height = self.map_grid.pixel_size
+            enemy = (self.map_grid.enemy_area+1) * cs #the +1 is the ring empty_around keeps clear
+            hero = (self.map_grid.hero_area+1) * cs
             for x in xrange(self.map_grid.size[0]):
                 for y in xrange(self.map_grid.size[1]):
                     if not self.map_grid.is_open((x, y)):
-                        pygame.draw.rect(bo, (200,0,0,125), (self.map_grid.grid_to_screen((x, y)), (20,20)))
-            pygame.draw.rect(bo, (200,0,0,125), ((0,0), (11*20,11*20)))
-            pygame.draw.rect(bo, (200,0,0,125), ((800-9*20,500-9*20), (9*20,9*20)))
+                        pygame.draw.rect(bo, (200,0,0,125), (self.map_grid.grid_to_screen((x, y)), (cs,cs)))
+            pygame.draw.rect(bo, (200,0,0,125), ((0,0), (enemy,enemy)))
+            pygame.draw.rect(bo, (200,0,0,125), ((width-hero,height-hero), (hero,hero)))
 
             self.build_overlay = bo
 
@@ -957,11 +977,12 @@ class Game(GameState):
                 if event.button == 1:
                     if self.selected_object:
                         self.selected_object.selected = False
-                    if event.pos[1] <= 500: #this is for us!
+                    if event.pos[1] <= self.map_grid.pixel_size[1]: #this is for us!
                         grid = self.map_grid.screen_to_grid(event.pos)
                         if self.build_active:
                             if self.building == objects.TowerBase:
-                                if self.map_grid.empty_around(grid):
+                                #no walling the insects off, they would have nowhere to go
+                                if self.map_grid.empty_around(grid) and not self.map_grid.placement_impact(grid)[0]:
                                     self.build_active = False
                                     objects.BuildTower(self, self.map_grid.grid_to_screen(grid))
                                     for i in self.bot_group.objects:
@@ -986,6 +1007,8 @@ class Game(GameState):
             if event.type == KEYDOWN:
                 if event.key == K_s:
                     pygame.image.save(self.screen, "test.png")
+                if event.key == K_p:
+                    self.map_grid.telemetry.dump("pathstats.txt") #who has been asking for paths
 
         used = False
         for i in self.app.widgets:
@@ -997,6 +1020,8 @@ class Game(GameState):
         if not used:
             self.status_message.set(None)
 
+        self.map_grid.next_frame()
+        self.map_grid.update_requests() #finish off some queued path searches before anyone looks for them
         self.hero_group.update()
         self.hive_group.update()
         self.build_tower_group.update()
@@ -1016,7 +1041,8 @@ class Game(GameState):
         if self.build_active:
             self.screen.blit(self.build_overlay, (0,0))
 
-        pygame.draw.rect(self.screen, (255,0,255), (self.map_grid.screen_to_screen(pygame.mouse.get_pos()), (20,20)), 2)
+        cs = self.map_grid.cell_size
+        pygame.draw.rect(self.screen, (255,0,255), (self.map_grid.screen_to_screen(pygame.mouse.get_pos()), (cs,cs)), 2)
 
         self.main_group.render()
         self.flying_group.render()
@@ -1028,26 +1054,32 @@ class Game(GameState):
             grid = self.map_grid.screen_to_grid((x,y))
             if self.building == objects.TowerBase:
                 if self.map_grid.empty_around(grid):
-                    i = data.image(self.building.ui_icon)
-                    r = i.get_rect()
-                    r.midbottom = x+10, y+20
-                    self.screen.blit(i, r)
+                    cuts, extra = self.map_grid.placement_impact(grid)
+                    if not cuts:
+                        i = data.image(self.building.ui_icon)
+                        r = i.get_rect()
+                        r.midbottom = self.map_grid.cell_midbottom(grid)
+                        self.screen.blit(i, r)
+                        if extra:
+                            #how much longer the insects' walk gets
+                            note = self.font.render("+%s"%extra, 1, (255,255,255))
+                            self.screen.blit(note, note.get_rect(midbottom=r.midtop))
             else:
                 if self.map_grid.is_open(grid):
                     i = data.image(self.building.ui_icon)
                     r = i.get_rect()
-                    r.midbottom = x+10, y+20
+                    r.midbottom = self.map_grid.cell_midbottom(grid)
                     self.screen.blit(i, r)
             
 
 
-        self.screen.blit(self.ui_background, (0,500))
+        self.screen.blit(self.ui_background, (0,self.ui_top))
         
         self.app.render()
         self.screen.blit(self.money_ui, self.money_ui_pos)
         self.screen.blit(self.scraps_ui, self.scraps_ui_pos)
         self.screen.blit(self.kills_ui, self.kills_ui_pos)
-        self.screen.blit(self.font.render("units: %s/20"%len(self.bot_group.objects), 1, (255,255,255)), (90,570))
+        self.screen.blit(self.font.render("units: %s/20"%len(self.bot_group.objects), 1, (255,255,255)), (90,self.ui_top+70))
 
         if self.hero.was_killed:
             self.parent.use_child("lose")
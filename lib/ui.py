@@ -247,10 +247,11 @@ class TowerInfo(Widget):
         pygame.draw.rect(self.image, (0,0,0), (0,0,180,135), 2)
         self.rect = self.image.get_rect()
         self.set_pos((tower.rect.centerx, tower.rect.bottom-10))
-        if self.rect.right > 800:
-            self.rect.right = 800
-        if self.rect.bottom > 600:
-            self.rect.bottom = 600
+        screen = self.app.surf.get_rect()
+        if self.rect.right > screen.right:
+            self.rect.right = screen.right
+        if self.rect.bottom > screen.bottom:
+            self.rect.bottom = screen.bottom
         if self.rect.left < 0:
             self.rect.left = 0
         if self.rect.top < 0: